@@ -0,0 +1,171 @@
+"""Piece sprites and sounds for the pygame front end.
+
+The twelve piece SVGs are baked into one PNG atlas per square size and kept in
+an on-disk cache keyed by the SVGs' modification times, so a normal start
+loads a single PNG instead of rasterizing twelve SVGs. AssetLoader does that
+work, and the sound decoding, on a background thread while the first screen
+is already up.
+"""
+import hashlib
+import os
+import sys
+import threading
+
+import pygame
+
+PIECE_COLORS = ("W", "B")
+PIECE_TYPES = ("K", "Q", "R", "B", "N", "P")
+# The SVGs are 128px canvases over a 45-unit viewBox; some SVG loaders ignore the viewBox
+# and only paint the top-left 45/128 of the canvas, so that corner is cropped out first
+VIEWBOX_FRACTION = 45 / 128
+
+
+def resource_path(relative_path):
+    try:
+        # If bundled by PyInstaller
+        base_path = sys._MEIPASS
+    except AttributeError:
+        # If running normally
+        base_path = os.path.abspath(".")
+
+    return os.path.join(base_path, relative_path)
+
+
+def cache_dir():
+    # A per-user directory, since a PyInstaller bundle may be read-only
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "chesspy")
+
+
+def piece_path(name):
+    return resource_path(f"assets/{name}.svg")
+
+
+def atlas_key():
+    # Changes whenever any piece SVG is replaced or edited
+    digest = hashlib.sha1()
+    for color in PIECE_COLORS:
+        for piece_type in PIECE_TYPES:
+            try:
+                stat = os.stat(piece_path(color + piece_type))
+                digest.update(f"{color}{piece_type}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+            except OSError:
+                digest.update(f"{color}{piece_type}:missing;".encode())
+    return digest.hexdigest()[:16]
+
+
+def rasterize_piece(name, square_size):
+    image_path = piece_path(name)
+    try:
+        image = pygame.image.load(image_path)
+    except pygame.error as e:
+        print(f"Error loading image {image_path}: {e}")
+        return None
+    width, height = image.get_size()
+    viewbox = pygame.Rect(0, 0, round(width * VIEWBOX_FRACTION), round(height * VIEWBOX_FRACTION))
+    if viewbox.contains(image.get_bounding_rect()):
+        image = image.subsurface(viewbox)
+    # Scale the image to fit the square size using smoothscale for better quality
+    return pygame.transform.smoothscale(image, (square_size, square_size))
+
+
+def bake_atlas(square_size):
+    """Rasterize every piece into one surface: a row per color, a column per piece type."""
+    atlas = pygame.Surface((square_size * len(PIECE_TYPES), square_size * len(PIECE_COLORS)), pygame.SRCALPHA)
+    missing = set()
+    for row, color in enumerate(PIECE_COLORS):
+        for col, piece_type in enumerate(PIECE_TYPES):
+            image = rasterize_piece(color + piece_type, square_size)
+            if image is None:
+                missing.add(color + piece_type)
+            else:
+                atlas.blit(image, (col * square_size, row * square_size))
+    return atlas, missing
+
+
+def load_atlas(square_size):
+    """Return (atlas, missing piece names), from the disk cache when it is current."""
+    directory = cache_dir()
+    prefix = f"pieces-{square_size}-"
+    path = os.path.join(directory, f"{prefix}{atlas_key()}.png")
+    if os.path.exists(path):
+        try:
+            return pygame.image.load(path), set()
+        except pygame.error as e:
+            print(f"Error loading cached atlas {path}: {e}")
+
+    atlas, missing = bake_atlas(square_size)
+    if missing:
+        return atlas, missing # Never cache a partial atlas
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.png"
+        pygame.image.save(atlas, temp_path)
+        os.replace(temp_path, path)
+        # Atlases baked from older SVGs for this size are dead weight now
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and os.path.join(directory, name) != path:
+                os.remove(os.path.join(directory, name))
+    except (OSError, pygame.error) as e:
+        print(f"Could not cache piece atlas in {directory}: {e}")
+    return atlas, missing
+
+
+def load_sound(relative_path):
+    try:
+        return pygame.mixer.Sound(resource_path(relative_path))
+    except pygame.error as e:
+        print(f"Could not load sound file: {e}")
+        return None
+
+
+class AssetLoader:
+    """Loads the sounds and the piece atlas for one square size on a background thread."""
+    def __init__(self, square_size):
+        self.square_size = square_size
+        self.move_sound = None
+        self.capture_sound = None
+        self.atlas = None
+        self.missing = set()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.move_sound = load_sound("assets/move.mp3")
+            self.capture_sound = load_sound("assets/capture.mp3")
+            self.atlas, self.missing = load_atlas(self.square_size)
+        except Exception as e:
+            print(f"Error loading assets: {e}")
+        finally:
+            self.done.set()
+
+    def wait(self):
+        self.done.wait()
+        return self
+
+
+class PieceSprites:
+    """Piece images cut from the atlas once per square size and converted for fast blitting."""
+    def __init__(self):
+        self.loader = None
+        self.square_size = None
+        self.images = {}
+
+    def get(self, color, piece_type, square_size):
+        if square_size != self.square_size: # Window or square size changed, load again
+            if self.loader is not None and self.loader.square_size == square_size:
+                atlas, missing = self.loader.wait().atlas, self.loader.missing
+            else:
+                atlas, missing = load_atlas(square_size)
+            self.images = {}
+            self.square_size = square_size
+            for row, image_color in enumerate(PIECE_COLORS):
+                for col, image_type in enumerate(PIECE_TYPES):
+                    if atlas is None or image_color + image_type in missing:
+                        self.images[image_color + image_type] = None
+                        continue
+                    area = pygame.Rect(col * square_size, row * square_size, square_size, square_size)
+                    self.images[image_color + image_type] = atlas.subsurface(area).convert_alpha()
+        return self.images.get(color + piece_type)
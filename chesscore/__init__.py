@@ -0,0 +1,17 @@
+"""Headless chess rules shared by the game client, perft and servers.
+
+Importing this package never pulls in pygame or networking code; tools such
+as ``chesscore.perft`` are only loaded when first accessed.
+"""
+import importlib
+
+from .board import Board, Colors, Piece, Pieces
+from .game import apply_move, game_over_message, insufficient_material
+
+_LAZY_MODULES = ("perft",)
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
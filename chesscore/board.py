@@ -0,0 +1,711 @@
+"""Chess rules: pieces, the board, move generation and position hashing.
+
+Pure Python with no pygame or network imports, so servers, workers and
+tools can use the rules without the game client.
+"""
+import random
+
+from .tables import (BETWEEN, BISHOP_RAYS, BISHOP_SLIDERS, KING_REACH, KING_TARGETS, KNIGHT_REACH,
+                     KNIGHT_TARGETS, NO_SQUARES, PAWN_ATTACKS, RAYS, ROOK_RAYS, ROOK_SLIDERS)
+
+Pieces = ["P", "R", "N", "B", "Q", "K"]
+Colors = ["W", "B"]
+
+# Zobrist keys, seeded so every client hashes a position the same way
+_zobrist_random = random.Random(20240601)
+ZOBRIST_PIECES = {color + piece: [_zobrist_random.getrandbits(64) for _ in range(64)] for color in Colors for piece in Pieces}
+ZOBRIST_BLACK_TO_MOVE = _zobrist_random.getrandbits(64)
+ZOBRIST_CASTLING = {(color, side): _zobrist_random.getrandbits(64) for color in Colors for side in ("k", "q")}
+ZOBRIST_EN_PASSANT = [_zobrist_random.getrandbits(64) for _ in range(8)]
+
+# Nibble codes for Board.to_bytes; 13 and 14 fold en passant and castling rights into the board
+PACKED_CODES = ["", "WP", "WN", "WB", "WR", "WQ", "WK", "BP", "BN", "BB", "BR", "BQ", "BK"]
+PACKED_EN_PASSANT_PAWN = 13
+PACKED_CASTLING_ROOK = 14
+PACKED_SIZE = 33 # 32 bytes of squares plus side to move and halfmove clock
+
+class Piece:
+    def __init__(self, x, y, color, piece):
+        self.x = x
+        self.y = y
+        self.color = color
+        self.piece = piece
+        self.en_passantable = False
+        if self.piece == "K":
+            self.castleable_k = True
+            self.castleable_q = True
+    def move(self, x, y,board):
+        # Store original position for potential promotion/sending move data
+        self.original_x, self.original_y = self.x, self.y
+
+        if not self.is_valid_move(x, y,board):
+            return False
+
+        board.make_move(self, x, y)
+        return True
+    
+
+    def is_valid_move(self, x, y,board):
+
+        if board.piece_at(x, y) != None:
+            if board.piece_at(x, y).color == self.color:
+                return False
+        if self.piece == "P":
+            if self.color == "B":
+                if self.y == 1 and y == 3 and x == self.x and board.piece_at(x, 2) == None and board.piece_at(x,y) == None:
+                    return True
+                if y == self.y + 1 and x == self.x and board.piece_at(x, y) == None:
+                    return True
+                if y == self.y+1 and abs(x-self.x) == 1 and board.piece_at(x, y) != None:
+                    return True
+                if board.piece_at(x, self.y) !=None:
+                    if abs(x-self.x) == 1 and y == self.y+1 and board.piece_at(x, self.y).en_passantable:
+                        return True
+
+            if self.color == "W":
+                if self.y == 6 and y == 4 and x == self.x and board.piece_at(x, 5) == None and board.piece_at(x,y) == None:
+                    return True
+                if y == self.y - 1 and x == self.x and board.piece_at(x, y) == None:
+                    return True
+                if y == self.y-1 and abs(x-self.x) == 1 and board.piece_at(x, y) != None:
+                    return True
+                if board.piece_at(x, self.y) !=None:
+                    if abs(x-self.x) == 1 and y == self.y-1 and board.piece_at(x, self.y).en_passantable:
+                        return True
+        square = self.y * 8 + self.x
+        target_square = y * 8 + x
+        if self.piece == "R" or self.piece == "B" or self.piece == "Q":
+            between = BETWEEN[square].get(target_square)
+            if between is None:
+                return False
+            orthogonal = self.x == x or self.y == y
+            if (self.piece == "R" and not orthogonal) or (self.piece == "B" and orthogonal):
+                return False
+            for check_x, check_y in between:
+                if board.squares[check_y * 8 + check_x] is not None:
+                    return False
+            return True
+        if self.piece == "N":
+            return target_square in KNIGHT_REACH[square]
+        if self.piece == "K":
+            if target_square in KING_REACH[square]:
+                return True
+            # Castling needs our rook in the corner and every square up to it empty
+            if self.y == y and ((self.castleable_k and x == self.x+2) or (self.castleable_q and x == self.x-2)):
+                corner_x = 7 if x > self.x else 0
+                rook = board.piece_at(corner_x, self.y)
+                if rook is None or rook.piece != "R" or rook.color != self.color:
+                    return False
+                for check_x, check_y in BETWEEN[square][self.y * 8 + corner_x]:
+                    if board.squares[check_y * 8 + check_x] is not None:
+                        return False
+                return True
+            
+        return False
+
+    def targets(self, board):
+        """Yield the squares is_valid_move accepts, without probing the whole board."""
+        if self.piece == "P":
+            step = 1 if self.color == "B" else -1
+            start_row = 1 if self.color == "B" else 6
+            y = self.y + step
+            if not 0 <= y < 8:
+                return
+            if board.piece_at(self.x, y) is None:
+                yield self.x, y
+                if self.y == start_row and board.piece_at(self.x, y + step) is None:
+                    yield self.x, y + step
+            for x in (self.x - 1, self.x + 1):
+                if not 0 <= x < 8:
+                    continue
+                target = board.piece_at(x, y)
+                if target is not None:
+                    if target.color != self.color:
+                        yield x, y
+                else:
+                    beside = board.piece_at(x, self.y)
+                    if beside is not None and beside.en_passantable:
+                        yield x, y
+            return
+
+        square = self.y * 8 + self.x
+        if self.piece == "N" or self.piece == "K":
+            for x, y, target_square in (KNIGHT_TARGETS if self.piece == "N" else KING_TARGETS)[square]:
+                target = board.squares[target_square]
+                if target is None or target.color != self.color:
+                    yield x, y
+            if self.piece == "K":
+                if self.castleable_k and self.x + 2 < 8 and self.is_valid_move(self.x + 2, self.y, board):
+                    yield self.x + 2, self.y
+                if self.castleable_q and self.x - 2 >= 0 and self.is_valid_move(self.x - 2, self.y, board):
+                    yield self.x - 2, self.y
+            return
+
+        if self.piece == "R":
+            rays = ROOK_RAYS[square]
+        elif self.piece == "B":
+            rays = BISHOP_RAYS[square]
+        else:
+            rays = RAYS[square]
+        for ray in rays:
+            for x, y, target_square in ray:
+                target = board.squares[target_square]
+                if target is not None:
+                    if target.color != self.color:
+                        yield x, y
+                    break
+                yield x, y
+    
+    def __eq__(self, other):
+        if not isinstance(other, Piece):
+            return False
+        return self.x == other.x and self.y == other.y and self.color == other.color and self.piece == other.piece
+
+class Board:
+    def __init__(self):
+        self.pieces = []
+        self.squares = [None] * 64 # Mailbox indexed by y*8 + x, kept in sync with self.pieces
+        self.kings = {} # Color -> king piece, for O(1) king lookups
+        self.en_passant = None # Pawn that can currently be captured en passant
+        self.undo_stack = [] # One record per make_move, popped by unmake_move
+        self.turn = "W" # Side to move, flipped by make_move
+        self.halfmove_clock = 0 # Plies since the last capture or pawn move (fifty-move rule)
+        self.fullmove_number = 1
+        self.zobrist_key = 0
+        self.move_cache = {} # Color -> (zobrist_key, legal moves, targets by from-square)
+        self.captured_pieces = []
+        # White pieces
+        for i in range(8):
+            self.add_piece(Piece(i, 1, "B", "P"))
+        self.add_piece(Piece(0, 0, "B", "R"))
+        self.add_piece(Piece(7, 0, "B", "R"))
+        self.add_piece(Piece(1, 0, "B", "N"))
+        self.add_piece(Piece(6, 0, "B", "N"))
+        self.add_piece(Piece(2, 0, "B", "B"))
+        self.add_piece(Piece(5, 0, "B", "B"))
+        self.add_piece(Piece(3, 0, "B", "Q"))
+        self.add_piece(Piece(4, 0, "B", "K"))
+        # Black pieces
+        for i in range(8):
+            self.add_piece(Piece(i, 6, "W", "P"))
+        self.add_piece(Piece(0, 7, "W", "R"))
+        self.add_piece(Piece(7, 7, "W", "R"))
+        self.add_piece(Piece(1, 7, "W", "N"))
+        self.add_piece(Piece(6, 7, "W", "N"))
+        self.add_piece(Piece(2, 7, "W", "B"))
+        self.add_piece(Piece(5, 7, "W", "B"))
+        self.add_piece(Piece(3, 7, "W", "Q"))
+        self.add_piece(Piece(4, 7, "W", "K"))
+        self.zobrist_key = self.compute_zobrist_key()
+    
+    def add_piece(self, piece, index=None):
+        if index is None:
+            self.pieces.append(piece)
+        else:
+            self.pieces.insert(index, piece)
+        self.squares[piece.y * 8 + piece.x] = piece
+        if piece.piece == "K":
+            self.kings[piece.color] = piece
+
+    def remove_piece(self, piece):
+        # Returns the list index so unmake_move can restore the original order
+        index = self.pieces.index(piece)
+        del self.pieces[index]
+        self.squares[piece.y * 8 + piece.x] = None
+        if self.kings.get(piece.color) is piece:
+            del self.kings[piece.color]
+        return index
+
+    def move_piece(self, piece, x, y):
+        # Relocate a piece without any rule checks, keeping the mailbox in sync
+        self.squares[piece.y * 8 + piece.x] = None
+        piece.x = x
+        piece.y = y
+        self.squares[y * 8 + x] = piece
+
+    def set_pieces(self, pieces):
+        self.pieces = []
+        self.squares = [None] * 64
+        self.kings = {}
+        self.en_passant = None
+        self.undo_stack = []
+        self.move_cache = {}
+        for piece in pieces:
+            self.add_piece(piece)
+            if piece.en_passantable:
+                self.en_passant = piece
+        self.zobrist_key = self.compute_zobrist_key()
+
+    @classmethod
+    def from_fen(cls, fen):
+        """Build a board from a FEN string; raises ValueError if it is malformed."""
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError(f"FEN needs at least 4 fields: {fen!r}")
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError(f"FEN placement needs 8 ranks: {fields[0]!r}")
+        pieces = []
+        for y, row in enumerate(rows):
+            x = 0
+            for char in row:
+                if char.isdigit():
+                    x += int(char)
+                elif char.upper() in Pieces:
+                    pieces.append(Piece(x, y, "W" if char.isupper() else "B", char.upper()))
+                    x += 1
+                else:
+                    raise ValueError(f"Unknown piece {char!r} in FEN")
+            if x != 8:
+                raise ValueError(f"FEN rank {8 - y} does not cover 8 files: {row!r}")
+        kings = [piece for piece in pieces if piece.piece == "K"]
+        if sorted(king.color for king in kings) != ["B", "W"]:
+            raise ValueError("FEN needs exactly one king per side")
+        if fields[1] not in ("w", "b"):
+            raise ValueError(f"Unknown side to move {fields[1]!r} in FEN")
+
+        for king in kings:
+            king.castleable_k = ("K" if king.color == "W" else "k") in fields[2]
+            king.castleable_q = ("Q" if king.color == "W" else "q") in fields[2]
+        turn = "W" if fields[1] == "w" else "B"
+        if fields[3] != "-":
+            if len(fields[3]) != 2 or fields[3][0] not in "abcdefgh" or fields[3][1] not in "36":
+                raise ValueError(f"Bad en passant square {fields[3]!r} in FEN")
+            ep_x = "abcdefgh".index(fields[3][0])
+            pawn_y = 4 if fields[3][1] == "3" else 3 # The pawn sits just past the skipped square
+            for piece in pieces:
+                if piece.piece == "P" and piece.x == ep_x and piece.y == pawn_y:
+                    piece.en_passantable = True
+
+        board = cls()
+        board.turn = turn
+        try:
+            board.halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            board.fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"Bad move counters in FEN: {fen!r}")
+        board.set_pieces(pieces)
+        return board
+
+    def to_fen(self):
+        rows = []
+        for y in range(8):
+            row = ""
+            empty = 0
+            for x in range(8):
+                piece = self.squares[y * 8 + x]
+                if piece is None:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                row += piece.piece if piece.color == "W" else piece.piece.lower()
+            if empty:
+                row += str(empty)
+            rows.append(row)
+
+        castling = ""
+        for color in Colors:
+            king = self.kings.get(color)
+            if king is not None and king.castleable_k:
+                castling += "K" if color == "W" else "k"
+            if king is not None and king.castleable_q:
+                castling += "Q" if color == "W" else "q"
+        en_passant = "-"
+        if self.en_passant is not None:
+            pawn = self.en_passant
+            skipped_y = pawn.y + 1 if pawn.color == "W" else pawn.y - 1
+            en_passant = "abcdefgh"[pawn.x] + str(8 - skipped_y)
+        return f"{'/'.join(rows)} {self.turn.lower()} {castling or '-'} {en_passant} {self.halfmove_clock} {self.fullmove_number}"
+
+    def gives_castling_right(self, rook):
+        king = self.kings.get(rook.color)
+        if king is None or rook.y != king.y:
+            return False
+        return (rook.x == 7 and king.castleable_k) or (rook.x == 0 and king.castleable_q)
+
+    def to_bytes(self):
+        """Pack the position into PACKED_SIZE bytes for storage or the network.
+
+        Each square is a nibble from PACKED_CODES; the pawn that can be taken en
+        passant and rooks that still give a castling right use the spare codes.
+        The last byte holds the side to move (high bit) and the halfmove clock.
+        The fullmove number is not stored.
+        """
+        nibbles = []
+        for piece in self.squares:
+            if piece is None:
+                nibbles.append(0)
+            elif piece is self.en_passant:
+                nibbles.append(PACKED_EN_PASSANT_PAWN)
+            elif piece.piece == "R" and self.gives_castling_right(piece):
+                nibbles.append(PACKED_CASTLING_ROOK)
+            else:
+                nibbles.append(PACKED_CODES.index(piece.color + piece.piece))
+        data = bytearray((nibbles[i] << 4) | nibbles[i + 1] for i in range(0, 64, 2))
+        data.append((0x80 if self.turn == "B" else 0) | min(self.halfmove_clock, 127))
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a board packed by to_bytes; raises ValueError on malformed data."""
+        if len(data) != PACKED_SIZE:
+            raise ValueError(f"Packed position must be {PACKED_SIZE} bytes, got {len(data)}")
+        pieces = []
+        castling_rooks = []
+        for square in range(64):
+            code = (data[square // 2] >> 4) if square % 2 == 0 else (data[square // 2] & 0x0F)
+            x, y = square % 8, square // 8
+            if code == 0:
+                continue
+            if code == PACKED_EN_PASSANT_PAWN:
+                if y not in (3, 4):
+                    raise ValueError(f"En passant pawn on an impossible rank at square {square}")
+                piece = Piece(x, y, "W" if y == 4 else "B", "P")
+                piece.en_passantable = True
+            elif code == PACKED_CASTLING_ROOK:
+                if y not in (0, 7) or x not in (0, 7):
+                    raise ValueError(f"Castling rook off its corner at square {square}")
+                piece = Piece(x, y, "W" if y == 7 else "B", "R")
+                castling_rooks.append(piece)
+            elif code < len(PACKED_CODES):
+                name = PACKED_CODES[code]
+                piece = Piece(x, y, name[0], name[1])
+            else:
+                raise ValueError(f"Unknown piece code {code} at square {square}")
+            pieces.append(piece)
+
+        kings = {piece.color: piece for piece in pieces if piece.piece == "K"}
+        if len(kings) != 2 or sum(piece.piece == "K" for piece in pieces) != 2:
+            raise ValueError("Packed position needs exactly one king per side")
+        for king in kings.values():
+            king.castleable_k = False
+            king.castleable_q = False
+        for rook in castling_rooks:
+            if rook.x == 7:
+                kings[rook.color].castleable_k = True
+            else:
+                kings[rook.color].castleable_q = True
+
+        board = cls()
+        board.turn = "B" if data[32] & 0x80 else "W"
+        board.halfmove_clock = data[32] & 0x7F
+        board.set_pieces(pieces)
+        return board
+
+    def castling_key(self):
+        key = 0
+        for color, king in self.kings.items():
+            if king.castleable_k:
+                key ^= ZOBRIST_CASTLING[(color, "k")]
+            if king.castleable_q:
+                key ^= ZOBRIST_CASTLING[(color, "q")]
+        return key
+
+    def en_passant_key(self):
+        # Only hashed when an enemy pawn could actually take en passant
+        pawn = self.en_passant
+        if pawn is None:
+            return 0
+        for x in (pawn.x - 1, pawn.x + 1):
+            beside = self.piece_at(x, pawn.y)
+            if beside is not None and beside.piece == "P" and beside.color != pawn.color:
+                return ZOBRIST_EN_PASSANT[pawn.x]
+        return 0
+
+    def compute_zobrist_key(self):
+        """Hash the position from scratch; make_move keeps zobrist_key in step incrementally."""
+        key = 0
+        for piece in self.pieces:
+            key ^= ZOBRIST_PIECES[piece.color + piece.piece][piece.y * 8 + piece.x]
+        if self.turn == "B":
+            key ^= ZOBRIST_BLACK_TO_MOVE
+        return key ^ self.castling_key() ^ self.en_passant_key()
+
+    def make_move(self, piece, x, y, promotion=None):
+        """Apply a move without validating it and push a record for unmake_move."""
+        from_x, from_y = piece.x, piece.y
+        castle_flags = tuple((king.castleable_k, king.castleable_q) for king in self.kings.values())
+        old_type = piece.piece
+        old_key = self.zobrist_key
+        old_clocks = (self.halfmove_clock, self.fullmove_number)
+        key = old_key ^ self.castling_key() ^ self.en_passant_key()
+
+        if piece.piece == "K" and abs(x-from_x) <= 1 and abs(y-from_y) <= 1:
+            piece.castleable_k = False
+            piece.castleable_q = False
+        if piece.piece == "R":
+            king = self.kings.get(piece.color)
+            if king is not None and from_x == 0 and from_y == king.y:
+                king.castleable_q = False
+            if king is not None and from_x == 7 and from_y == king.y:
+                king.castleable_k = False
+
+        rook, rook_from_x = None, None
+        if piece.piece == "K" and abs(x-from_x) == 2:
+            rook_from_x, rook_to_x = (x+1, x-1) if x > from_x else (x-2, x+1)
+            rook = self.piece_at(rook_from_x, from_y)
+            if rook is not None:
+                self.move_piece(rook, rook_to_x, from_y)
+                rook_keys = ZOBRIST_PIECES[rook.color + "R"]
+                key ^= rook_keys[from_y * 8 + rook_from_x] ^ rook_keys[from_y * 8 + rook_to_x]
+            piece.castleable_k = False
+            piece.castleable_q = False
+
+        captured = self.piece_at(x, y)
+        if piece.piece == "P" and x != from_x and captured is None:
+            captured = self.piece_at(x, from_y) # En passant
+        captured_index = None
+        if captured is not None:
+            self.captured_pieces.append(captured)
+            captured_index = self.remove_piece(captured)
+            key ^= ZOBRIST_PIECES[captured.color + captured.piece][captured.y * 8 + captured.x]
+            # A rook taken on its home corner takes that castling right with it
+            captured_king = self.kings.get(captured.color)
+            if captured.piece == "R" and captured_king is not None and captured.y == captured_king.y:
+                if captured.x == 0:
+                    captured_king.castleable_q = False
+                if captured.x == 7:
+                    captured_king.castleable_k = False
+
+        old_en_passant = self.en_passant
+        if old_en_passant is not None:
+            old_en_passant.en_passantable = False
+        self.en_passant = None
+        if piece.piece == "P" and abs(y-from_y) == 2:
+            piece.en_passantable = True
+            self.en_passant = piece
+
+        self.move_piece(piece, x, y)
+        if promotion:
+            piece.piece = promotion
+        self.turn = "B" if self.turn == "W" else "W"
+        self.halfmove_clock = 0 if old_type == "P" or captured is not None else self.halfmove_clock + 1
+        if piece.color == "B":
+            self.fullmove_number += 1
+
+        key ^= ZOBRIST_PIECES[piece.color + old_type][from_y * 8 + from_x]
+        key ^= ZOBRIST_PIECES[piece.color + piece.piece][y * 8 + x]
+        self.zobrist_key = key ^ ZOBRIST_BLACK_TO_MOVE ^ self.castling_key() ^ self.en_passant_key()
+
+        self.undo_stack.append((piece, from_x, from_y, old_type, captured, captured_index,
+                                rook, rook_from_x, old_en_passant, castle_flags, old_key, old_clocks))
+
+    def unmake_move(self):
+        """Revert the most recent make_move, including castling, captures and promotion."""
+        (piece, from_x, from_y, old_type, captured, captured_index,
+         rook, rook_from_x, old_en_passant, castle_flags, old_key, old_clocks) = self.undo_stack.pop()
+
+        piece.piece = old_type
+        self.move_piece(piece, from_x, from_y)
+        if rook is not None:
+            self.move_piece(rook, rook_from_x, from_y)
+        if captured is not None:
+            self.captured_pieces.pop()
+            self.add_piece(captured, captured_index)
+
+        if self.en_passant is not None:
+            self.en_passant.en_passantable = False
+        self.en_passant = old_en_passant
+        if old_en_passant is not None:
+            old_en_passant.en_passantable = True
+
+        for king, (castleable_k, castleable_q) in zip(self.kings.values(), castle_flags):
+            king.castleable_k = castleable_k
+            king.castleable_q = castleable_q
+        self.turn = "B" if self.turn == "W" else "W"
+        self.halfmove_clock, self.fullmove_number = old_clocks
+        self.zobrist_key = old_key
+
+    def promote(self, piece, choice):
+        """Change a pawn's type after the move that reached the last rank."""
+        square = piece.y * 8 + piece.x
+        self.zobrist_key ^= ZOBRIST_PIECES[piece.color + piece.piece][square] ^ ZOBRIST_PIECES[piece.color + choice][square]
+        piece.piece = choice
+
+    def piece_at(self, x, y):
+        if 0 <= x < 8 and 0 <= y < 8:
+            return self.squares[y * 8 + x]
+        return None
+    
+    def piece_pos(self, p, c):
+        if p == "K":
+            king = self.kings.get(c)
+            return (king.x, king.y) if king else None
+        for piece in self.pieces:
+            if piece.piece == p and piece.color == c:
+                return piece.x, piece.y
+        return None
+    
+    
+    def attackers(self, x, y, color):
+        """Return the pieces of the given color that attack square (x, y)."""
+        squares = self.squares
+        square = y * 8 + x
+        found = []
+        for targets, kind in ((KNIGHT_TARGETS, "N"), (KING_TARGETS, "K")):
+            for _, _, from_square in targets[square]:
+                piece = squares[from_square]
+                if piece is not None and piece.color == color and piece.piece == kind:
+                    found.append(piece)
+        # A pawn attacks (x, y) from wherever an opposite-colored pawn on (x, y) would attack
+        for _, _, from_square in PAWN_ATTACKS["W" if color == "B" else "B"][square]:
+            piece = squares[from_square]
+            if piece is not None and piece.color == color and piece.piece == "P":
+                found.append(piece)
+        for direction, ray in enumerate(RAYS[square]):
+            sliders = ROOK_SLIDERS if direction < 4 else BISHOP_SLIDERS
+            for _, _, from_square in ray:
+                piece = squares[from_square]
+                if piece is not None:
+                    if piece.color == color and piece.piece in sliders:
+                        found.append(piece)
+                    break
+        return found
+
+    def attacked_squares(self, color, ignore=None):
+        """Build the set of squares attacked by color, treating `ignore` as an empty square."""
+        squares = self.squares
+        attacked = set()
+        for piece in self.pieces:
+            if piece.color != color:
+                continue
+            square = piece.y * 8 + piece.x
+            if piece.piece == "P":
+                attacked.update((x, y) for x, y, _ in PAWN_ATTACKS[color][square])
+            elif piece.piece == "N" or piece.piece == "K":
+                attacked.update((x, y) for x, y, _ in (KNIGHT_TARGETS if piece.piece == "N" else KING_TARGETS)[square])
+            else:
+                if piece.piece == "R":
+                    rays = ROOK_RAYS[square]
+                elif piece.piece == "B":
+                    rays = BISHOP_RAYS[square]
+                else:
+                    rays = RAYS[square]
+                for ray in rays:
+                    for x, y, target_square in ray:
+                        attacked.add((x, y))
+                        target = squares[target_square]
+                        if target is not None and target is not ignore:
+                            break
+        return attacked
+
+    def pins(self, color):
+        """Map the square of each of color's pinned pieces to the squares it may still move to."""
+        king = self.kings[color]
+        pins = {}
+        for direction, ray in enumerate(RAYS[king.y * 8 + king.x]):
+            sliders = ROOK_SLIDERS if direction < 4 else BISHOP_SLIDERS
+            blocker = None
+            for index, (_, _, square) in enumerate(ray):
+                piece = self.squares[square]
+                if piece is None:
+                    continue
+                if blocker is not None:
+                    if piece.color != color and piece.piece in sliders:
+                        pins[(blocker.x, blocker.y)] = {(x, y) for x, y, _ in ray[:index + 1]}
+                    break
+                if piece.color != color:
+                    break
+                blocker = piece
+        return pins
+
+    def squares_between(self, from_x, from_y, to_x, to_y):
+        """Squares strictly between two squares on a shared line, empty if they are not aligned."""
+        return BETWEEN[from_y * 8 + from_x].get(to_y * 8 + to_x, NO_SQUARES)
+
+    def is_in_check(self,color):
+        king = self.kings[color]
+        return len(self.attackers(king.x, king.y, "B" if color == "W" else "W")) > 0
+
+    def is_legal(self, piece, x, y):
+        """Check that a pseudo-legal move does not leave the mover's king in check."""
+        color = piece.color
+        if piece.piece == "K" and abs(x - piece.x) == 2:
+            # The king may not castle out of, through or into check
+            start_x = piece.x
+            safe = True
+            for check_x in (start_x, (start_x + x)//2, x):
+                self.move_piece(piece, check_x, piece.y)
+                if self.is_in_check(color):
+                    safe = False
+                    break
+            self.move_piece(piece, start_x, piece.y)
+            return safe
+
+        self.make_move(piece, x, y)
+        legal = not self.is_in_check(color)
+        self.unmake_move()
+        return legal
+
+    def iter_valid_moves(self, color):
+        """Lazily yield legal moves so callers can stop at the first one.
+
+        Legality comes from the attack map, checkers and pins of the position,
+        so only en passant needs a trial make_move.
+        """
+        king = self.kings[color]
+        enemy = "B" if color == "W" else "W"
+        checkers = self.attackers(king.x, king.y, enemy)
+        # The king is ignored so it cannot step back along a slider's line of attack
+        danger = self.attacked_squares(enemy, ignore=king)
+
+        for x, y in king.targets(self):
+            if (x, y) in danger:
+                continue
+            if abs(x - king.x) == 2 and (checkers or ((king.x + x)//2, y) in danger):
+                continue
+            yield king, x, y
+
+        if len(checkers) > 1:
+            return
+        evasions = None
+        if checkers:
+            checker = checkers[0]
+            evasions = self.squares_between(king.x, king.y, checker.x, checker.y) | {(checker.x, checker.y)}
+        pins = self.pins(color)
+
+        for piece in [piece for piece in self.pieces if piece.color == color and piece is not king]:
+            pin_ray = pins.get((piece.x, piece.y))
+            for x, y in piece.targets(self):
+                if piece.piece == "P" and x != piece.x and self.piece_at(x, y) is None:
+                    # En passant removes two pieces from a line at once, so test it directly
+                    if self.is_legal(piece, x, y):
+                        yield piece, x, y
+                    continue
+                if evasions is not None and (x, y) not in evasions:
+                    continue
+                if pin_ray is not None and (x, y) not in pin_ray:
+                    continue
+                yield piece, x, y
+
+    def cached_moves(self, color):
+        """Legal moves for color, computed once per position.
+
+        Entries are keyed by zobrist_key, so any make_move or promote starts a
+        fresh list while unmake_move brings the old one back into use.
+        """
+        entry = self.move_cache.get(color)
+        if entry is None or entry[0] != self.zobrist_key:
+            moves = list(self.iter_valid_moves(color))
+            by_square = {}
+            for piece, x, y in moves:
+                by_square.setdefault(piece.y * 8 + piece.x, set()).add((x, y))
+            entry = (self.zobrist_key, moves, by_square)
+            self.move_cache[color] = entry
+        return entry
+
+    def has_valid_move(self, color):
+        return len(self.cached_moves(color)[1]) > 0
+
+    def valid_moves(self,color):
+        # Shared with every other caller in this position, so treat it as read-only
+        return self.cached_moves(color)[1]
+
+    def moves_from(self, x, y):
+        """Target squares of the legal moves for the piece on (x, y)."""
+        piece = self.piece_at(x, y)
+        if piece is None:
+            return set()
+        return self.cached_moves(piece.color)[2].get(y * 8 + x, set())
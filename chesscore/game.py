@@ -0,0 +1,52 @@
+"""Game flow on top of the board: applying move messages and detecting the end of a game."""
+
+
+def apply_move(board, move_data, board_states=None):
+    """Play a move message ({from_x, from_y, to_x, to_y, promotion}) on the board.
+
+    Returns True if the move captured a piece. When board_states (a Counter of
+    Zobrist keys) is given, the new position is counted for repetition.
+    """
+    piece = board.piece_at(move_data['from_x'], move_data['from_y'])
+    captured_before = len(board.captured_pieces)
+    piece.move(move_data['to_x'], move_data['to_y'], board)
+    if move_data.get('promotion'):
+        board.promote(piece, move_data['promotion'])
+    if board_states is not None:
+        board_states[board.zobrist_key] += 1
+    return len(board.captured_pieces) > captured_before
+
+
+def insufficient_material(board):
+    minors = [board.piece_pos(p, c) is not None for p, c in (("B", "W"), ("B", "B"), ("N", "W"), ("N", "B"))]
+    white_bishop, black_bishop, white_knight, black_knight = minors
+    if len(board.pieces) == 2:
+        return True
+    if len(board.pieces) == 3 and any(minors):
+        return True
+    if len(board.pieces) == 4 and ((white_bishop and black_bishop) or (white_knight and black_knight)):
+        return True
+    if len(board.pieces) == 4 and ((white_bishop and black_knight) or (white_knight and black_bishop)):
+        return True
+    return False
+
+
+def game_over_message(board, turn, board_states, fifty_move_rule):
+    """Return the game-over message with `turn` to move, or None while the game goes on.
+
+    When several endings apply, the later checks win, as they always have in the game loop.
+    """
+    message = None
+    if not board.has_valid_move(turn):
+        if board.is_in_check(turn):
+            winner = "Black" if turn == "W" else "White"
+            message = f"{winner} wins by checkmate"
+        else:
+            message = "Stalemate"
+    if insufficient_material(board):
+        message = "Draw by insufficient material"
+    if board_states[board.zobrist_key] >= 3:
+        message = "Draw by repetition"
+    if fifty_move_rule == 100:
+        message = "Draw by fifty move rule"
+    return message
@@ -0,0 +1,156 @@
+"""Perft: count the leaf nodes of the move tree to verify and benchmark move generation.
+
+Usage:
+    python -m chesscore.perft                      # run the reference suite and check node counts
+    python -m chesscore.perft --depth 4 --divide   # per-move breakdown of the start position
+    python -m chesscore.perft --fen "<FEN>" --depth 3
+    python -m chesscore.perft --bench              # run the suite and append timings to perft_results.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from .board import Board
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Reference positions with known node counts per depth (from the Chess Programming Wiki)
+REFERENCE_POSITIONS = [
+    ("start", START_FEN, [20, 400, 8902, 197281]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1", [48, 2039, 97862]),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238]),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467]),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379]),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10", [46, 2079, 89890]),
+]
+
+PROMOTION_CHOICES = ["Q", "R", "B", "N"]
+
+
+def square_name(x, y):
+    return "abcdefgh"[x] + str(8 - y)
+
+
+def legal_moves(board, color):
+    """Expand pawn moves onto the last rank into one move per promotion choice."""
+    for piece, x, y in list(board.iter_valid_moves(color)):
+        if piece.piece == "P" and (y == 0 or y == 7):
+            for choice in PROMOTION_CHOICES:
+                yield piece, x, y, choice
+        else:
+            yield piece, x, y, None
+
+
+def perft(board, color, depth):
+    if depth == 0:
+        return 1
+    other = "B" if color == "W" else "W"
+    nodes = 0
+    for piece, x, y, promotion in legal_moves(board, color):
+        if depth == 1:
+            nodes += 1
+            continue
+        board.make_move(piece, x, y, promotion)
+        nodes += perft(board, other, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def divide(board, color, depth):
+    """Return (move, nodes) for every root move, e.g. ("e2e4", 8102)."""
+    other = "B" if color == "W" else "W"
+    results = []
+    for piece, x, y, promotion in legal_moves(board, color):
+        name = square_name(piece.x, piece.y) + square_name(x, y) + (promotion or "").lower()
+        board.make_move(piece, x, y, promotion)
+        results.append((name, perft(board, other, depth - 1)))
+        board.unmake_move()
+    return results
+
+
+def timed_perft(fen, depth):
+    board = Board.from_fen(fen)
+    start = time.perf_counter()
+    nodes = perft(board, board.turn, depth)
+    seconds = time.perf_counter() - start
+    return nodes, seconds
+
+
+def run_suite(max_depth=None):
+    """Check every reference position at each listed depth; returns result dicts."""
+    results = []
+    for name, fen, expected_counts in REFERENCE_POSITIONS:
+        for depth, expected in enumerate(expected_counts, start=1):
+            if max_depth is not None and depth > max_depth:
+                break
+            nodes, seconds = timed_perft(fen, depth)
+            nps = nodes / seconds if seconds > 0 else 0.0
+            status = "ok" if nodes == expected else "FAIL"
+            print(f"{name:10} depth {depth}: {nodes:>9} nodes (expected {expected:>9}) {status:4} {seconds:7.3f}s {nps:>10.0f} nps")
+            results.append({"name": name, "fen": fen, "depth": depth, "nodes": nodes, "expected": expected,
+                            "seconds": round(seconds, 4), "nps": round(nps)})
+    return results
+
+
+def record_results(path, results):
+    """Append one benchmark run to a JSON file holding the list of previous runs."""
+    try:
+        with open(path) as f:
+            runs = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        runs = []
+    runs.append({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "total_nodes": sum(result["nodes"] for result in results),
+        "total_seconds": round(sum(result["seconds"] for result in results), 4),
+        "results": results,
+    })
+    with open(path, "w") as f:
+        json.dump(runs, f, indent=2)
+    print(f"Results appended to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verify and benchmark the chess move generator.")
+    parser.add_argument("--fen", help="Position to search instead of running the reference suite")
+    parser.add_argument("--depth", type=int, help="Search depth (with --fen, or to cap the suite)")
+    parser.add_argument("--divide", action="store_true", help="Print the node count under each root move")
+    parser.add_argument("--bench", action="store_true", help="Record suite timings to a JSON file")
+    parser.add_argument("--output", default="perft_results.json", help="JSON file for --bench results")
+    args = parser.parse_args()
+
+    if args.fen or args.divide:
+        fen = args.fen or START_FEN
+        depth = args.depth or 3
+        board = Board.from_fen(fen)
+        start = time.perf_counter()
+        if args.divide:
+            results = divide(board, board.turn, depth)
+            for name, nodes in sorted(results):
+                print(f"{name}: {nodes}")
+            nodes = sum(count for _, count in results)
+            print(f"\nMoves: {len(results)}")
+        else:
+            nodes = perft(board, board.turn, depth)
+        seconds = time.perf_counter() - start
+        nps = nodes / seconds if seconds > 0 else 0.0
+        print(f"Nodes: {nodes}  Time: {seconds:.3f}s  NPS: {nps:.0f}")
+        return 0
+
+    results = run_suite(args.depth)
+    failures = [result for result in results if result["nodes"] != result["expected"]]
+    total_nodes = sum(result["nodes"] for result in results)
+    total_seconds = sum(result["seconds"] for result in results)
+    print(f"\n{len(results) - len(failures)}/{len(results)} passed, {total_nodes} nodes in {total_seconds:.2f}s "
+          f"({total_nodes / total_seconds if total_seconds else 0:.0f} nps)")
+    if args.bench:
+        record_results(args.output, results)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
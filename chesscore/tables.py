@@ -0,0 +1,74 @@
+"""Move geometry tables, built once at import.
+
+Squares are indexed y * 8 + x, the same layout as Board.squares. Table
+entries are (x, y, square) triples so callers can use whichever form fits.
+"""
+
+KNIGHT_OFFSETS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+KING_OFFSETS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+ROOK_DIRECTIONS = [(1, 0), (0, 1), (-1, 0), (0, -1)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (-1, -1), (1, -1)]
+DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS # Indexes 0-3 are orthogonal, 4-7 diagonal
+
+ROOK_SLIDERS = ("R", "Q")
+BISHOP_SLIDERS = ("B", "Q")
+NO_SQUARES = frozenset()
+
+
+def _offset_table(offsets):
+    table = []
+    for square in range(64):
+        x, y = square % 8, square // 8
+        table.append(tuple((x + dx, y + dy, (y + dy) * 8 + x + dx) for dx, dy in offsets
+                           if 0 <= x + dx < 8 and 0 <= y + dy < 8))
+    return table
+
+
+def _ray_table():
+    table = []
+    for square in range(64):
+        x, y = square % 8, square // 8
+        rays = []
+        for dx, dy in DIRECTIONS:
+            ray = []
+            ray_x, ray_y = x + dx, y + dy
+            while 0 <= ray_x < 8 and 0 <= ray_y < 8:
+                ray.append((ray_x, ray_y, ray_y * 8 + ray_x))
+                ray_x += dx
+                ray_y += dy
+            rays.append(tuple(ray))
+        table.append(tuple(rays))
+    return table
+
+
+def _between_table(rays):
+    # Walking each ray outward, the squares already passed are the ones between
+    table = []
+    for square_rays in rays:
+        between = {}
+        for ray in square_rays:
+            passed = []
+            for x, y, target in ray:
+                between[target] = frozenset(passed)
+                passed.append((x, y))
+        table.append(between)
+    return table
+
+
+KNIGHT_TARGETS = _offset_table(KNIGHT_OFFSETS)
+KING_TARGETS = _offset_table(KING_OFFSETS)
+KNIGHT_REACH = [frozenset(target for _, _, target in targets) for targets in KNIGHT_TARGETS]
+KING_REACH = [frozenset(target for _, _, target in targets) for targets in KING_TARGETS]
+
+# Squares a pawn of each color attacks from a square; pawns of one color that
+# attack a square stand on the squares the other color's pawn would attack from it
+PAWN_ATTACKS = {"W": _offset_table([(-1, -1), (1, -1)]), "B": _offset_table([(-1, 1), (1, 1)])}
+
+# RAYS[square][direction] lists the squares outward from square, nearest first
+RAYS = _ray_table()
+ROOK_RAYS = [rays[:4] for rays in RAYS]
+BISHOP_RAYS = [rays[4:] for rays in RAYS]
+
+# BETWEEN[a].get(b) is the set of (x, y) strictly between two aligned squares,
+# or None when a and b do not share a rank, file or diagonal
+BETWEEN = _between_table(RAYS)
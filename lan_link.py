@@ -0,0 +1,183 @@
+"""Persistent TCP link between the two players of a LAN game.
+
+After the HTTP connect handshake the joining player opens one TCP connection to
+the host, and both directions of the game travel over it as length-prefixed
+JSON messages: a 4-byte big-endian length, then that many bytes of UTF-8 JSON.
+Keepalive messages flow both ways, so a peer that goes silent for a few
+intervals is treated as dropped. The joiner then reconnects in the background,
+and callers fall back to HTTP while the link is down.
+"""
+import json
+import socket
+import struct
+import threading
+
+HEADER = struct.Struct(">I")
+MAX_MESSAGE_BYTES = 64 * 1024 # Far above any move or offer; anything larger is a broken peer
+KEEPALIVE = {"type": "keepalive"}
+
+
+class PeerLink:
+    """One framed TCP connection to the opponent; send() returns False whenever the link is down."""
+    def __init__(self, on_message, keepalive_sec=2.0, missed_keepalives=3, allowed_peer=None):
+        self.on_message = on_message # Called on the reader thread with (message, peer_ip)
+        self.allowed_peer = allowed_peer # Returns the only IP the host accepts a link from; None accepts any
+        self.keepalive_sec = keepalive_sec
+        self.timeout_sec = keepalive_sec * missed_keepalives
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.connection = None
+        self.listener = None
+        self.reconnect_address = None
+        self.keepalive_thread = None
+
+    def is_connected(self):
+        return self.connection is not None
+
+    def listen(self, port):
+        """Host side: accept the opponent's link in the background; a new connection replaces the old one."""
+        try:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind(("0.0.0.0", port))
+            listener.listen(1)
+        except OSError as e:
+            print(f"Could not listen for a LAN link on port {port}: {e}")
+            return False
+        self.listener = listener
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+        self.start_keepalive()
+        return True
+
+    def accept_loop(self):
+        while not self.closed.is_set():
+            try:
+                connection, address = self.listener.accept()
+            except OSError:
+                return # Listener closed
+            # Anything else on the LAN (a port scanner, say) must not take over the opponent's link
+            if self.allowed_peer is not None and address[0] != self.allowed_peer():
+                print(f"Ignoring LAN link attempt from {address[0]}")
+                connection.close()
+                continue
+            self.attach(connection, address[0])
+
+    def connect(self, host, port):
+        """Joining side: open the link now and keep reopening it if it drops. Returns whether it is up."""
+        self.reconnect_address = (host, port)
+        self.start_keepalive()
+        return self.open(host, port)
+
+    def open(self, host, port):
+        try:
+            connection = socket.create_connection((host, port), timeout=5)
+        except OSError as e:
+            print(f"LAN link to {host}:{port} unavailable, using HTTP: {e}")
+            return False
+        self.attach(connection, host)
+        return True
+
+    def attach(self, connection, peer_ip):
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Moves are tiny; don't batch them
+        connection.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        connection.settimeout(self.timeout_sec)
+        with self.lock:
+            old, self.connection = self.connection, connection
+        if old is not None:
+            old.close()
+        print(f"LAN link up with {peer_ip}")
+        threading.Thread(target=self.read_loop, args=(connection, peer_ip), daemon=True).start()
+
+    def read_loop(self, connection, peer_ip):
+        try:
+            while not self.closed.is_set():
+                message = json.loads(self.read_exactly(connection, self.read_length(connection)).decode("utf-8"))
+                if not isinstance(message, dict):
+                    raise ValueError(f"expected a JSON object, got {type(message).__name__}")
+                if message != KEEPALIVE:
+                    self.handle(message, peer_ip)
+        except socket.timeout:
+            print(f"LAN link to {peer_ip} went silent, dropping it")
+        except (OSError, ValueError) as e:
+            if not self.closed.is_set():
+                print(f"LAN link to {peer_ip} dropped: {e}")
+        finally:
+            self.drop(connection)
+
+    def handle(self, message, peer_ip):
+        # A message the game can't act on is skipped; it must not end the link's only reader
+        try:
+            self.on_message(message, peer_ip)
+        except Exception as e:
+            print(f"Error handling LAN link message {message}: {e}")
+
+    def read_length(self, connection):
+        (length,) = HEADER.unpack(self.read_exactly(connection, HEADER.size))
+        if length > MAX_MESSAGE_BYTES:
+            raise ValueError(f"message of {length} bytes is too large")
+        return length
+
+    def read_exactly(self, connection, count):
+        data = b""
+        while len(data) < count:
+            chunk = connection.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError("peer closed the link")
+            data += chunk
+        return data
+
+    def drop(self, connection):
+        with self.lock:
+            if self.connection is connection:
+                self.connection = None
+        connection.close()
+        if self.reconnect_address is not None and not self.closed.is_set():
+            threading.Thread(target=self.reconnect_loop, daemon=True).start()
+
+    def reconnect_loop(self):
+        delay_sec = 0.5
+        while not self.closed.is_set() and self.connection is None:
+            if self.open(*self.reconnect_address):
+                return
+            self.closed.wait(delay_sec)
+            delay_sec = min(delay_sec * 2, 5)
+
+    def send(self, message):
+        data = json.dumps(message).encode("utf-8")
+        with self.lock:
+            connection = self.connection
+            if connection is None:
+                return False
+            try:
+                connection.sendall(HEADER.pack(len(data)) + data)
+                return True
+            except OSError as e:
+                print(f"LAN link send failed: {e}")
+        # The reader notices the broken socket too; shut it down so that happens now
+        try:
+            connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        return False
+
+    def start_keepalive(self):
+        if self.keepalive_thread is None:
+            self.keepalive_thread = threading.Thread(target=self.keepalive_loop, daemon=True)
+            self.keepalive_thread.start()
+
+    def keepalive_loop(self):
+        while not self.closed.wait(self.keepalive_sec):
+            self.send(KEEPALIVE)
+
+    def close(self):
+        self.closed.set()
+        if self.listener is not None:
+            try:
+                self.listener.shutdown(socket.SHUT_RDWR) # Wakes the blocked accept() on Linux
+            except OSError:
+                pass
+            self.listener.close()
+        with self.lock:
+            connection, self.connection = self.connection, None
+        if connection is not None:
+            connection.close()
@@ -1,25 +1,43 @@
 import http.server
 import random
-import socketserver
 import threading
 import json
-from queue import Queue, Empty
+from queue import Queue, Empty, Full
 import urllib.request
 import urllib.parse
 import socket # To get local IP if hosting
-import platform
 import requests
 from requests import Session
 import time
 import requests.exceptions
-import sys
-from copy import deepcopy
+import uuid
+from collections import Counter, deque
+from functools import lru_cache
 import pygame
 import os
+from chesscore import Board, apply_move, game_over_message
+from assets import AssetLoader, PieceSprites
+from lan_link import PeerLink
+try:
+    import websockets
+    from websockets.sync.client import connect as websocket_connect
+    from websockets.exceptions import WebSocketException
+    if int(websockets.__version__.split(".")[0]) < 15: # Older connect() rejects ping_interval/ping_timeout
+        websocket_connect = None
+except ImportError: # Optional: only needed for the WebSocket transport (CHESSPY_SOCKET_SERVER)
+    websocket_connect = None
 
-Pieces = ["P", "R", "N", "B", "Q", "K"]
-Colors = ["W", "B"]
 size = 600/8
+frame_rate = 30 # Frame cap for every screen; the game only redraws squares that changed
+idle_timeout_ms = 250 # Longest an idle game sleeps before checking the network again
+network_event = pygame.USEREVENT + 1 # Posted by network threads to wake an idle main loop
+long_poll_timeout_sec = 20 # How long the server may hold an /events request before answering unchanged
+STATE_NOT_MODIFIED = "NOT_MODIFIED" # fetch_state's answer when the room's version hasn't moved
+socket_heartbeat_sec = 10 # Ping interval on a room WebSocket; a missed pong drops and reopens it
+# Online polling intervals, overridable from the environment (see PollSchedule)
+poll_fast_ms = int(os.environ.get("CHESSPY_POLL_FAST_MS", 100)) # While the opponent owes us a move or an answer
+poll_idle_ms = int(os.environ.get("CHESSPY_POLL_IDLE_MS", 500)) # First backoff step when nothing is expected
+poll_max_ms = int(os.environ.get("CHESSPY_POLL_MAX_MS", 3000)) # Backoff ceiling, idle or after errors
 move_queue = Queue() # Queue to pass moves from server thread to main thread
 client_connected_event = threading.Event() # Event to signal client connection
 play_again = threading.Event()
@@ -32,6 +50,7 @@ my_turn = None
 # Store temporary move data during promotion selection
 pending_promotion_move = None
 http_server = None # To hold the server instance
+lan_link_port = 8001 # The host listens here for the joiner's persistent link
 move_sound = None # Variable to store move sound
 capture_sound = None # Variable to store capture sound
 opponent_move_queue = Queue()
@@ -39,92 +58,117 @@ offer_queue = Queue()
 player_status_queue = Queue()
 poller_stop_event = threading.Event()
 sender_stop_event = threading.Event()
-send_queue = Queue()
+room_created_queue = Queue() # The new room's code from create_online_room, or None if the server failed
+send_queue = Queue(maxsize=64) # (method, path, json, message id) for the sender; filled by queue_send
+ack_queue = Queue() # (message id, "delivered" | "superseded" | "failed") back from the sender
+unacked_sends = {} # Message id -> (path, time queued); only touched by the UI thread
+send_retry_deadline_sec = 90 # How long a request keeps being retried; long enough for a server cold start
+send_timeout_sec = (5, 10) # Connect and read timeouts for each attempt
+send_lag_sec = 1.5 # Unacknowledged for this long, a send shows in the title bar
+failed_send_path = None # Path of the last send that failed, until a later one gets through
+window_caption = None
 polling_thread = None
 sender_thread = None
 last_offer_handled = None # To track offers processed by main thread
 
-def resource_path(relative_path):
-    try:
-        # If bundled by PyInstaller
-        base_path = sys._MEIPASS
-    except AttributeError:
-        # If running normally
-        base_path = os.path.abspath(".")
-
-    return os.path.join(base_path, relative_path)
-
+def handle_peer_message(data, peer_ip):
+    """Act on one message from the LAN opponent, whether it came over HTTP or the TCP link.
+
+    Returns the (status, body) an HTTP sender gets back.
+    """
+    global opponent_ip
+    # Check if it's a move or a connection ping
+    if data.get('type') == 'connect':
+        print(f"Client connected from {peer_ip}")
+        # --- Store opponent IP on Host ---
+        if is_host and opponent_ip is None: # Only set if we are host and IP isn't already set
+            opponent_ip = peer_ip
+            print(f"Opponent IP automatically set to: {opponent_ip}")
+        # ----------------------------------
+        # Signal the main thread that the client has connected
+        client_connected_event.set()
+        return 200, b'Connection acknowledged'
+    elif data.get('type') == 'play_again':
+        print(f"Play again received from {peer_ip}")
+        play_again.set()
+        wake_main_thread()
+        return 200, b'Play again acknowledged'
+    elif data.get('type') == 'resign':
+        print(f"Resign received from {peer_ip}")
+        resign.set()
+        wake_main_thread()
+        return 200, b'Resign acknowledged'
+    elif data.get('type') == 'draw':
+        print(f"Draw received from {peer_ip}")
+        draw.set()
+        wake_main_thread()
+        return 200, b'Draw acknowledged'
+    elif data.get('from_x') is not None: # Assume it's a move if core keys exist
+        # Add the received move data to the queue for the main thread
+        move_queue.put(data)
+        wake_main_thread()
+        return 200, b'Move received'
+    print("Received unrecognized data format.")
+    return 400, b'Unrecognized data'
+
+class MoveRequestHandler(http.server.BaseHTTPRequestHandler):
+    # Per-connection socket timeout, so a stalled or half-open client only ties up its own thread
+    timeout = 5
+    max_body_bytes = 16 * 1024 # Moves and offers are well under 1 KB
 
-class MoveRequestHandler(http.server.SimpleHTTPRequestHandler):
     def do_POST(self):
-        global move_queue
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
+        try:
+            content_length = int(self.headers['Content-Length'])
+        except (TypeError, ValueError):
+            self.reply(411, b'Content-Length required')
+            return
+        if content_length < 0 or content_length > self.max_body_bytes:
+            self.reply(413, b'Request too large')
+            return
+        try:
+            post_data = self.rfile.read(content_length)
+        except OSError as e: # Includes the read timeout
+            print(f"Error reading request from {self.client_address[0]}: {e}")
+            self.close_connection = True
+            return
         try:
             data = json.loads(post_data.decode('utf-8'))
-            print(f"Received data: {data}") # Debugging
-
-            # Check if it's a move or a connection ping
-            if data.get('type') == 'connect':
-                print(f"Client connected from {self.client_address[0]}")
-                # --- Store opponent IP on Host ---
-                global opponent_ip, is_host
-                if is_host and opponent_ip is None: # Only set if we are host and IP isn't already set
-                    opponent_ip = self.client_address[0]
-                    print(f"Opponent IP automatically set to: {opponent_ip}")
-                # ----------------------------------
-                # Signal the main thread that the client has connected
-                client_connected_event.set()
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'Connection acknowledged')
-            elif data.get('type') == 'play_again':
-                print(f"Play again received from {self.client_address[0]}")
-                play_again.set()
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'Play again acknowledged')
-            elif data.get('type') == 'resign':
-                print(f"Resign received from {self.client_address[0]}")
-                resign.set()
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'Resign acknowledged')
-            elif data.get('type') == 'draw':
-                print(f"Draw received from {self.client_address[0]}")
-                draw.set()
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'Draw acknowledged')
-                
-            elif data.get('from_x') is not None: # Assume it's a move if core keys exist
-                 # Add the received move data to the queue for the main thread
-                move_queue.put(data)
-                self.send_response(200)
-                self.end_headers()
-                self.wfile.write(b'Move received')
-            else:
-                 print("Received unrecognized data format.")
-                 self.send_response(400)
-                 self.end_headers()
-                 self.wfile.write(b'Unrecognized data')
-
-        except json.JSONDecodeError:
+            status, body = handle_peer_message(data, self.client_address[0])
+        except (json.JSONDecodeError, UnicodeDecodeError):
             print("Error decoding received data.")
-            self.send_response(400)
-            self.end_headers()
-            self.wfile.write(b'Invalid JSON')
+            status, body = 400, b'Invalid JSON'
         except Exception as e:
             print(f"Error processing request: {e}")
-            self.send_response(500)
-            self.end_headers()
-            self.wfile.write(b'Server error')
+            status, body = 500, b'Server error'
+        self.reply(status, body)
+
+    def reply(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class LanHTTPServer(http.server.ThreadingHTTPServer):
+    # Every connection gets its own thread; none of them keeps the game from exiting
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 32 # Room for bursts of connects (retries, a reconnecting peer) past the default 5
+
+# Persistent framed TCP link to the LAN opponent; the HTTP server above stays as the fallback
+lan_link = PeerLink(handle_peer_message, allowed_peer=lambda: opponent_ip) # Set by the joiner's HTTP connect
+
+def wake_main_thread():
+    # pygame.event.post is safe from other threads; it fails only once the display is gone
+    try:
+        pygame.event.post(pygame.event.Event(network_event))
+    except pygame.error:
+        pass
 
 def start_server(port=8000):
     handler = MoveRequestHandler
     # Use 0.0.0.0 to listen on all available interfaces
     try:
-        httpd = socketserver.TCPServer(("0.0.0.0", port), handler)
+        httpd = LanHTTPServer(("0.0.0.0", port), handler)
         print(f"Hosting on port {port}")
         server_thread = threading.Thread(target=httpd.serve_forever)
         server_thread.daemon = True # Allows program to exit even if thread is running
@@ -135,8 +179,15 @@ def start_server(port=8000):
         print("Is another instance running or is the port busy?")
         return None
 
+def stop_server(httpd):
+    # Stop accepting, wait for serve_forever to return, then release the port
+    httpd.shutdown()
+    httpd.server_close()
+
 
 def send_move(target_ip, port, move_data):
+    if lan_link.send(move_data):
+        return
     if not target_ip:
         print("Error: Opponent IP not set.")
         return
@@ -173,7 +224,9 @@ def send_connection_ping(target_ip, port):
         return False # Indicate failure
 
 def send_offer(target_ip, port, type, color):
-    """Sends a simple message to the host to indicate connection."""
+    """Sends a resign, draw or play-again offer to the opponent."""
+    if lan_link.send({'type': type, 'color': color}):
+        return True
     if not target_ip:
         print("Error: Target IP not set for offer.")
         return False
@@ -192,349 +245,166 @@ def send_offer(target_ip, port, type, color):
         return False # Indicate failure
 
 
-class Piece:
-    def __init__(self, x, y, color, piece):
-        self.x = x
-        self.y = y
-        self.color = color
-        self.piece = piece
-        self.en_passantable = False
-        if self.piece == "K":
-            self.castleable_k = True
-            self.castleable_q = True
-    def move(self, x, y,board):
-        # Store original position for potential promotion/sending move data
-        self.original_x, self.original_y = self.x, self.y
-
-        if not self.is_valid_move(x, y,board):
-            return False
-        
-        if self.piece == "K" and abs(x-self.x) <= 1 and abs(y-self.y) <= 1:
-            self.castleable_k = False
-            self.castleable_q = False
-        if self.piece == "R":
-            if self.color == "W":
-                king = board.piece_at(board.piece_pos("K", "W")[0], board.piece_pos("K", "W")[1])
-            else:
-                king = board.piece_at(board.piece_pos("K", "B")[0], board.piece_pos("K", "B")[1])
-            if self.x == 0 and self.y == king.y:
-                king.castleable_q = False
-            if self.x == 7 and self.y == king.y:
-                king.castleable_k = False
-        
-        if self.piece == "K" and abs(x-self.x) == 2:
-            if x > self.x:
-                board.piece_at(x+1, self.y).move(x-1, self.y, board)
-            else:
-                board.piece_at(x-2, self.y).move(x+1, self.y, board)
-            self.castleable_k = False
-            self.castleable_q = False
-        
-        if self.piece == "P" and abs(y-self.y) == 1 and abs(x-self.x) == 1 and board.piece_at(x, y) == None and board.piece_at(x, self.y) != None:
-            board.captured_pieces.append(board.piece_at(x, self.y))
-            board.pieces.remove(board.piece_at(x, self.y))
-        
-        if board.piece_at(x, y) != None:
-            board.captured_pieces.append(board.piece_at(x, y))
-            board.pieces.remove(board.piece_at(x, y))
-        
-        for piece in board.pieces:
-                piece.en_passantable = False
-        if self.piece == "P" and abs(y-self.y) == 2:
-            self.en_passantable = True
+piece_sprites = PieceSprites()
 
-        
-        self.x = x
-        self.y = y
-        return True
-    
 
-    def is_valid_move(self, x, y,board):
-
-        if board.piece_at(x, y) != None:
-            if board.piece_at(x, y).color == self.color:
-                return False
-        if self.piece == "P":
-            if self.color == "B":
-                if self.y == 1 and y == 3 and x == self.x and board.piece_at(x, 2) == None and board.piece_at(x,y) == None:
-                    return True
-                if y == self.y + 1 and x == self.x and board.piece_at(x, y) == None:
-                    return True
-                if y == self.y+1 and abs(x-self.x) == 1 and board.piece_at(x, y) != None:
-                    return True
-                if board.piece_at(x, self.y) !=None:
-                    if abs(x-self.x) == 1 and y == self.y+1 and board.piece_at(x, self.y).en_passantable:
-                        return True
-
-            if self.color == "W":
-                if self.y == 6 and y == 4 and x == self.x and board.piece_at(x, 5) == None and board.piece_at(x,y) == None:
-                    return True
-                if y == self.y - 1 and x == self.x and board.piece_at(x, y) == None:
-                    return True
-                if y == self.y-1 and abs(x-self.x) == 1 and board.piece_at(x, y) != None:
-                    return True
-                if board.piece_at(x, self.y) !=None:
-                    if abs(x-self.x) == 1 and y == self.y-1 and board.piece_at(x, self.y).en_passantable:
-                        return True
-        if self.piece == "R":
-            if self.x == x:  # Moving vertically
-                step = 1 if y > self.y else -1
-                for check_y in range(self.y + step, y, step):
-                    if board.piece_at(x, check_y) is not None:
-                        return False
-                return True
-            elif self.y == y:  # Moving horizontally 
-                step = 1 if x > self.x else -1
-                for check_x in range(self.x + step, x, step):
-                    if board.piece_at(check_x, self.y) is not None:
-                        return False
-                return True
-        if self.piece == "B":
-            if self.x -x == self.y - y:
-                step = 1 if x > self.x else -1
-                for check_x in range(self.x + step, x, step):
-                    if board.piece_at(check_x, self.y + (check_x - self.x)) is not None:
-                        return False
-                return True
-            elif self.x - x == y - self.y:
-                step = 1 if x > self.x else -1
-                for check_x in range(self.x + step, x, step):
-                    if board.piece_at(check_x, self.y - (check_x - self.x)) is not None:
-                        return False
-                return True
-        if self.piece == "N":
-            if abs(self.x-x) == 2 and abs(self.y-y) == 1:
-                return True
-            elif abs(self.x-x) == 1 and abs(self.y-y) == 2:
-                return True
-        if self.piece == "K":
-            if abs(self.x-x) <= 1 and abs(self.y-y) <= 1:
-                return True
-            if self.castleable_k and self.y == y and x == self.x+2:
-                step = 1
-                for check_x in range(self.x+1, x, step):
-                    if board.piece_at(check_x, self.y) is not None:
-                        return False
-                return True
-            if self.castleable_q and self.y == y and x == self.x-2:
-                step = -1
-                for check_x in range(self.x-1, x, step):
-                    if board.piece_at(check_x, self.y) is not None:
-                        return False
-                return True
-            
-        if self.piece == "Q":
-            if self.x -x == self.y - y:
-                step = 1 if x > self.x else -1
-                for check_x in range(self.x + step, x, step):
-                    if board.piece_at(check_x, self.y + (check_x - self.x)) is not None:
-                        return False
-                return True
-            elif self.x - x == y - self.y:
-                step = 1 if x > self.x else -1
-                for check_x in range(self.x + step, x, step):
-                    if board.piece_at(check_x, self.y - (check_x - self.x)) is not None:
-                        return False
-                return True
-            elif self.x == x:  # Moving vertically
-                step = 1 if y > self.y else -1
-                for check_y in range(self.y + step, y, step):
-                    if board.piece_at(x, check_y) is not None:
-                        return False
-                return True
-            elif self.y == y:  # Moving horizontally 
-                step = 1 if x > self.x else -1
-                for check_x in range(self.x + step, x, step):
-                    if board.piece_at(check_x, self.y) is not None:
-                        return False
-                return True
-            
-        return False
-    
-    def draw(self, screen, player_color):
-        piece_size = 600/16
-        image_name = f"{self.color}{self.piece}.svg"
-        # The 'assets' folder is directly in the project root
-        image_path = resource_path(f"assets/{image_name}")
-        try:
-            piece_image = pygame.image.load(image_path)
-            # Scale the image to fit the square size using smoothscale for better quality
-            if platform.system() == 'Darwin': # macOS
-                    target_size = (int(size), int(size))
-            else: # Windows or other OS
-                target_size = (200, 200)
-            piece_image = pygame.transform.smoothscale(piece_image, target_size)
-            # Calculate pixel position: board offset (100, 0) + grid position * size
-            c,r = self.x, self.y
-            if player_color == "B":
-                c = 7 - c
-                r = 7 - r
-            draw_x = 100 + c * size
-            draw_y = r * size
-            
-            screen.blit(piece_image, (draw_x, draw_y))
-        except pygame.error as e:
-            print(f"Error loading image {image_path}: {e}")
-            # Fallback: draw a colored rectangle if image fails
-            fallback_color = (255, 0, 0) if self.color == 'W' else (0, 0, 255)
-            pygame.draw.rect(screen, fallback_color, (100 + self.x * size, self.y * size, size, size))
+@lru_cache(maxsize=None)
+def get_font(font_size):
+    # The default font at each size is loaded once and shared by every screen
+    return pygame.font.Font(None, font_size)
 
-    def __eq__(self, other):
-        if not isinstance(other, Piece):
-            return False
-        return self.x == other.x and self.y == other.y and self.color == other.color and self.piece == other.piece
 
-class Board:
-    def __init__(self):
-        self.pieces = []
-        self.side_menu = SideMenu()
-        self.captured_pieces = []
-        # White pieces
-        for i in range(8):
-            self.pieces.append(Piece(i, 1, "B", "P"))
-        self.pieces.append(Piece(0, 0, "B", "R"))
-        self.pieces.append(Piece(7, 0, "B", "R"))
-        self.pieces.append(Piece(1, 0, "B", "N"))
-        self.pieces.append(Piece(6, 0, "B", "N"))
-        self.pieces.append(Piece(2, 0, "B", "B"))
-        self.pieces.append(Piece(5, 0, "B", "B"))
-        self.pieces.append(Piece(3, 0, "B", "Q"))
-        self.pieces.append(Piece(4, 0, "B", "K"))
-        # Black pieces
-        for i in range(8):
-            self.pieces.append(Piece(i, 6, "W", "P"))
-        self.pieces.append(Piece(0, 7, "W", "R"))
-        self.pieces.append(Piece(7, 7, "W", "R"))
-        self.pieces.append(Piece(1, 7, "W", "N"))
-        self.pieces.append(Piece(6, 7, "W", "N"))
-        self.pieces.append(Piece(2, 7, "W", "B"))
-        self.pieces.append(Piece(5, 7, "W", "B"))
-        self.pieces.append(Piece(3, 7, "W", "Q"))
-        self.pieces.append(Piece(4, 7, "W", "K"))
-    
-    def piece_at(self, x, y):
-        for piece in self.pieces:
-            if piece.x == x and piece.y == y:
-                return piece
-        return None
-    
-    def piece_pos(self, p, c):
-        for piece in self.pieces:
-            if piece.piece == p and piece.color == c:
-                return piece.x, piece.y
-        return None
-    
-    
-    def is_in_check(self,color):
-        king_pos = self.piece_pos("K", color)
-        for piece in self.pieces:
-            if piece.color != color:
-                if piece.is_valid_move(king_pos[0], king_pos[1],self):
-                    return True
-        return False
+@lru_cache(maxsize=256)
+def render_text(text, font_size, color, max_width=None):
+    """Rendered text, smoothscaled down to max_width when wider; shared so redraws are only blits."""
+    text_surface = get_font(font_size).render(text, True, color)
+    text_width = text_surface.get_width()
+    text_height = text_surface.get_height()
+    if max_width is not None and text_width > max_width:
+        scale_factor = max_width / text_width
+        text_surface = pygame.transform.smoothscale(text_surface,
+            (int(text_width * scale_factor), int(text_height * scale_factor)))
+    return text_surface
 
-    def valid_moves(self,color):
-        valid_moves = []
-        for piece in self.pieces:
-            if piece.color == color:
-                for r in range(8):
-                    for c in range(8):
-                        if piece.is_valid_move(c, r,self):
-                            valid_moves.append((piece,c,r))
-
-        final_valid_moves = []
-        for move in valid_moves:
-            hypothetical_board = Board()
-            hypothetical_board.pieces = deepcopy(self.pieces)
-            move_piece = move[0]
-            move_x = move[1]
-            move_y = move[2]
-            hypo_piece = hypothetical_board.piece_at(move_piece.x, move_piece.y)
-            
-            if move_piece.piece == "K" and abs(move_x - move_piece.x) == 2:
-                if hypothetical_board.is_in_check(move_piece.color):
-                    continue
-                else:
-                    hypo_piece.x= (move_x - hypo_piece.x)//2 + hypo_piece.x
-                    if hypothetical_board.is_in_check(move_piece.color):
-                        continue
-                    hypo_piece.x = move_x
-                    if hypothetical_board.is_in_check(move_piece.color):
-                        continue     
-            
-            hypo_piece.move(move_x, move_y, hypothetical_board)
 
-            if not hypothetical_board.is_in_check(color):
-                final_valid_moves.append(move)
+EMPTY_SQUARE = (None, False, False, None)
 
-        return final_valid_moves
-    
 
-    
-    def draw(self, screen, player_color, selected_piece=None, last_move=None):
+class BoardView:
+    """Draws a Board; the rules themselves live in chesscore and know nothing of pygame."""
+    def __init__(self):
+        self.side_menu = SideMenu()
+        self.shown = None # What each screen square showed last frame, None forces a full redraw
+        self.shown_overlays = None
+        self.layer_size = None # Square size the background and markers were rendered for
+        self.check_key = None # Position the cached check status belongs to
+        self.checked = []
+
+    def build_layers(self):
+        square_size = int(size)
+        if square_size == self.layer_size:
+            return
+        self.layer_size = square_size
+        # Checkerboard drawn once; frames blit it instead of 64 rects
+        self.background = pygame.Surface((8 * square_size, 8 * square_size)).convert()
         for row in range(8):
             for col in range(8):
                 color = (255, 255, 255) # White
                 if (row + col) % 2 != 0:
                     color = (50, 100, 50) # Faded deep green
-                pygame.draw.rect(screen, color, (100+col*size, row*size, size, size))
-        
-        
-        white_king_pos = self.piece_pos("K", "W")
-        black_king_pos = self.piece_pos("K", "B")
-        black_king_pos_x, black_king_pos_y = 0,0
-        white_king_pos_x, white_king_pos_y = 0,0
+                self.background.fill(color, (col * square_size, row * square_size, square_size, square_size))
+        center = (square_size / 2, square_size / 2)
+        radius = int(size / 6)
+        self.check_marker = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+        pygame.draw.circle(self.check_marker, (255, 0, 0), center, size/2)
+        # Translucent yellow for the last move's destination
+        self.highlight = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+        self.highlight.fill((255, 255, 0, 100))
+        center = (int(size / 2), int(size / 2))
+        self.move_hint = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+        pygame.draw.circle(self.move_hint, (150, 150, 150), center, radius)
+        self.capture_hint = pygame.Surface((square_size, square_size), pygame.SRCALPHA)
+        pygame.draw.circle(self.capture_hint, (150, 150, 150), center, radius*3, width=5) # Hollow ring around the target
+
+    def invalidate(self):
+        # Something else drew over the window, so the next frame repaints everything
+        self.shown = None
+
+    def draw_piece(self, screen, piece, player_color):
+        # Calculate pixel position: board offset (100, 0) + grid position * size
+        c,r = piece.x, piece.y
         if player_color == "B":
-            white_king_pos_x = 7 - white_king_pos[0]
-            white_king_pos_y = 7 - white_king_pos[1]
-            black_king_pos_x = 7 - black_king_pos[0]
-            black_king_pos_y = 7 - black_king_pos[1]
-        elif player_color == "W":
-            white_king_pos_x = white_king_pos[0]
-            white_king_pos_y = white_king_pos[1]
-            black_king_pos_x = black_king_pos[0]
-            black_king_pos_y = black_king_pos[1]
-        if self.is_in_check("W"):
-            pygame.draw.circle(screen, (255, 0, 0), (100 + white_king_pos_x * size + size / 2, white_king_pos_y * size + size / 2), size/2)
-        if self.is_in_check("B"):
-            pygame.draw.circle(screen, (255, 0, 0), (100 + black_king_pos_x * size + size / 2, black_king_pos_y * size + size / 2), size/2)
-        
+            c = 7 - c
+            r = 7 - r
+        draw_x = 100 + c * size
+        draw_y = r * size
+        piece_image = piece_sprites.get(piece.color, piece.piece, int(size))
+        if piece_image is not None:
+            screen.blit(piece_image, (draw_x, draw_y))
+        else:
+            # Fallback: draw a colored rectangle if image fails
+            fallback_color = (255, 0, 0) if piece.color == 'W' else (0, 0, 255)
+            pygame.draw.rect(screen, fallback_color, (draw_x, draw_y, size, size))
+
+    def square_states(self, board, player_color, selected_piece, last_move):
+        # One tuple per screen square holding everything that is drawn on it
+        if board.zobrist_key != self.check_key: # Check status only changes with the position
+            self.check_key = board.zobrist_key
+            self.checked = [color for color in ("W", "B") if board.is_in_check(color)]
+        checked = self.checked
+        last_square = (last_move['to_x'], last_move['to_y']) if last_move else None
+        hints = board.moves_from(selected_piece.x, selected_piece.y) if selected_piece else ()
+        states = []
+        for row in range(8):
+            for col in range(8):
+                x, y = (7 - col, 7 - row) if player_color == "B" else (col, row)
+                piece = board.piece_at(x, y)
+                hint = None
+                if (x, y) in hints:
+                    hint = "capture" if piece is not None else "move"
+                states.append((
+                    piece.color + piece.piece if piece is not None else None,
+                    piece is not None and piece.piece == "K" and piece.color in checked,
+                    (x, y) == last_square,
+                    hint,
+                ))
+        return states
+
+    def draw_square(self, screen, col, row, state, board, player_color, background=True):
+        _, checked, highlighted, hint = state
+        rect = pygame.Rect(100 + col * size, row * size, size, size)
+        if background:
+            screen.blit(self.background, rect, rect.move(-100, 0))
+        if checked:
+            screen.blit(self.check_marker, rect)
+        if highlighted:
+            screen.blit(self.highlight, rect)
+        x, y = (7 - col, 7 - row) if player_color == "B" else (col, row)
+        piece = board.piece_at(x, y)
+        if piece is not None:
+            self.draw_piece(screen, piece, player_color)
         # Draw valid move indicators if a piece is selected
-        if last_move:
-            last_x, last_y = last_move['to_x'], last_move['to_y']
-            if player_color == "B":
-                last_x = 7 - last_x
-                last_y = 7 - last_y
-            # Create a translucent yellow surface
-            highlight = pygame.Surface((size, size), pygame.SRCALPHA)
-            pygame.draw.rect(highlight, (255, 255, 0, 100), highlight.get_rect())
-            screen.blit(highlight, (100 + last_x * size, last_y * size))
-        
-        for piece in self.pieces:
-            piece.draw(screen, player_color)
-        
+        if hint == "move":
+            screen.blit(self.move_hint, rect)
+        elif hint == "capture":
+            screen.blit(self.capture_hint, rect)
+        return rect
+
+    def draw(self, screen, board, player_color, selected_piece=None, last_move=None, overlays=(), draw_offered=False):
+        """Redraw what changed since the last frame and return the dirty rects for display.update."""
+        self.build_layers()
+        states = self.square_states(board, player_color, selected_piece, last_move)
+        overlay_keys = [overlay.key for overlay in overlays] + [draw_offered]
+        if self.shown is None or overlay_keys != self.shown_overlays:
+            changed = range(64)
+        else:
+            changed = [square for square in range(64) if states[square] != self.shown[square]]
+        if not changed:
+            return []
+        # Overlays cover several squares, so any change beneath one repaints the whole window
+        full = len(changed) == 64 or any(overlays) or draw_offered
+        if full:
+            screen.fill((0, 0, 0))
+            screen.blit(self.background, (100, 0))
+            # Only squares with something on them need more than the background
+            changed = [square for square in range(64) if states[square] != EMPTY_SQUARE]
+        dirty = [self.draw_square(screen, square % 8, square // 8, states[square], board, player_color, not full) for square in changed]
+        self.shown = states
+        self.shown_overlays = overlay_keys
+        if not full:
+            return dirty
         self.side_menu.draw(screen)
-
-        if selected_piece:
-            valid_moves = self.valid_moves(selected_piece.color)
-            for move in valid_moves:
-                if move[0] == selected_piece:
-                    c,r = move[1], move[2]
-                    if player_color == "B":
-                        c = 7 - c
-                        r = 7 - r
-                    center_x = int(100 + c * size + size / 2)
-                    center_y = int(r * size + size / 2)
-                    radius = int(size / 6)
-                    if self.piece_at(move[1], move[2]) == None:
-                        pygame.draw.circle(screen, (150, 150, 150, 150), (center_x, center_y), radius) # Added alpha for transparency
-                    else:
-                        pygame.draw.circle(screen, (150, 150, 150, 150), (center_x, center_y), radius*3, width=5) # Draw hollow circle with 2px width
+        for overlay in overlays:
+            overlay.draw(screen)
+        if draw_offered:
+            self.side_menu.highlight_draw(screen)
+        return [screen.get_rect()]
 
 class Promotion:
     def __init__(self, x, y, color):
         self.color = color
         self.piece_types = ['Q', 'R', 'B', 'N'] # Order matters
+        self.key = ("promotion", x, y, color)
         
         # Menu size: 4 squares wide, 1 square tall
         self.menu_width = size * len(self.piece_types)
@@ -563,18 +433,7 @@ class Promotion:
         
         self.images = {}
         for piece_type in self.piece_types:
-            try:
-                img_path = resource_path(f"assets/{self.color}{piece_type}.svg") 
-                img = pygame.image.load(img_path) 
-                # Scale based on OS
-                if platform.system() == 'Darwin': # macOS
-                    target_size = (int(size), int(size))
-                else: # Windows or other OS
-                    target_size = (200, 200)
-                self.images[piece_type] = pygame.transform.smoothscale(img, target_size)
-            except pygame.error as e:
-                print(f"Error loading promotion image {img_path}: {e}")
-                self.images[piece_type] = None
+            self.images[piece_type] = piece_sprites.get(self.color, piece_type, int(size))
 
     def draw(self, screen):
         pygame.draw.rect(screen, (200, 200, 200), self.menu_rect) # Background
@@ -599,44 +458,42 @@ class Promotion:
 class Gameover:
     def __init__(self, message):
         self.message = message
+        self.key = ("gameover", message)
+        self.panel = None # Rendered on first draw, then only blitted
     
     def draw(self, screen):
-        main_font = pygame.font.Font(None, 100)
-        small_font = pygame.font.Font(None, 30) # Smaller font for play again
-        
+        if self.panel is None:
+            self.panel = self.render_panel()
+        screen.blit(self.panel, self.panel_rect)
+
+    def render_panel(self):
         # Draw a filled rectangle behind the text
         rect_width = 600
         rect_height = 150
         rect_x = 400 - rect_width//2  # Center horizontally
         rect_y = 300 - rect_height//2 # Center vertically
-        pygame.draw.rect(screen, (50, 50, 50), (rect_x, rect_y, rect_width, rect_height))
-        pygame.draw.rect(screen, (255, 255, 255), (rect_x, rect_y, rect_width, rect_height), 2)  # White border
+        self.panel_rect = pygame.Rect(rect_x, rect_y, rect_width, rect_height)
+        panel = pygame.Surface(self.panel_rect.size).convert()
+        panel.fill((50, 50, 50))
+        pygame.draw.rect(panel, (255, 255, 255), panel.get_rect(), 2)  # White border
         
-        # Render and potentially scale the main game over message
-        text = main_font.render(self.message, True, (255, 255, 255))
-        text_rect = text.get_rect(center=(400, 300)) # Initial position
-        text_width = text.get_width()
-        text_height = text.get_height()
-        if text_width > rect_width - 40:
-            scale_factor = (rect_width - 40) / text_width
-            scaled_text = pygame.transform.smoothscale(text, 
-                (int(text_width * scale_factor), int(text_height * scale_factor)))
-            text_rect = scaled_text.get_rect(center=(400, 300)) # Recalculate rect after scaling
-            screen.blit(scaled_text, text_rect)
-        else:
-            screen.blit(text, text_rect)
+        # Render the main game over message, scaled down if it would not fit
+        text = render_text(self.message, 100, (255, 255, 255), rect_width - 40)
+        text_rect = text.get_rect(center=(400 - rect_x, 300 - rect_y))
+        panel.blit(text, text_rect)
         
         # Render and position the "Play Again" text below the main message
-        play_again_surf = small_font.render("Enter to Play Again", True, (200, 200, 200)) # Slightly dimmer color
+        play_again_surf = render_text("Enter to Play Again", 30, (200, 200, 200)) # Slightly dimmer color
         # Position below the main text_rect, centered horizontally
         play_again_rect = play_again_surf.get_rect(centerx=text_rect.centerx, top=text_rect.bottom + 10) 
-        screen.blit(play_again_surf, play_again_rect)
+        panel.blit(play_again_surf, play_again_rect)
+        return panel
 
 class SideMenu:
     def __init__(self):
-        self.font = pygame.font.Font(None, 30)
-        self.resign_text = self.font.render("Resign", True, (255, 255, 255))
-        self.draw_text = self.font.render("Draw", True, (255, 255, 255))
+        self.resign_text = render_text("Resign", 30, (255, 255, 255))
+        self.draw_text = render_text("Draw", 30, (255, 255, 255))
+        self.highlight_text = render_text("Draw", 30, (0, 0, 0))
         self.resign_button = pygame.Rect(710, 100, 80, 40)
         self.draw_button = pygame.Rect(710, 160, 80, 40)
         self.resign_rect = self.resign_text.get_rect(center=self.resign_button.center)
@@ -657,52 +514,240 @@ class SideMenu:
     
     def highlight_draw(self, screen):
         pygame.draw.rect(screen, (255, 255, 0), self.draw_button, 0)
-        newTest = self.font.render("Draw", True, (0,0,0))
-        screen.blit(newTest, self.draw_rect)
+        screen.blit(self.highlight_text, self.draw_rect)
 
         
 
 def do_move(move_data, board, my_turn, turn, fifty_move_rule, drawed, board_states, last_move):
         print(f"my_turn: {my_turn}")
         print(f"turn: {turn}")
-        piece_to_move = board.piece_at(move_data['from_x'], move_data['from_y'])
         last_move = move_data
-        oldlen = len(board.captured_pieces)
-        piece_to_move.move(move_data['to_x'], move_data['to_y'],board)
+        is_capture = apply_move(board, move_data, board_states)
         my_turn = not my_turn if my_turn != None else None
-        move_sound.play()
-        is_pawn_move = piece_to_move.piece == "P"
-        is_capture = len(board.captured_pieces) > oldlen
-        if 'promotion' in move_data and move_data['promotion']:
-            piece_to_move.piece = move_data['promotion']
+        if move_sound:
+            move_sound.play()
         if is_capture and capture_sound:
             capture_sound.play()
-        if is_pawn_move or is_capture:
-            fifty_move_rule = 0
-        else:
-            fifty_move_rule += 1
+        fifty_move_rule = board.halfmove_clock
         turn = "B" if turn == "W" else "W"
         drawed = set([])
-        board_states.append(deepcopy(board.pieces))
         return my_turn, turn, fifty_move_rule, drawed, board_states, last_move
 
-def online_poller(session, site, server_ip, stop_event, move_q, offer_q, players_q, poll_interval_sec, initial_last_move, initial_last_offer, initial_last_players):
+def is_next_move(move_data, board, game_number, last_move):
+    # Numbered moves must be the next ply of this game; anything else is an echo or a repeat
+    if not move_data:
+        return False
+    if "ply" not in move_data: # From a client that doesn't number its moves
+        return move_data != last_move
+    return move_data.get("game") == game_number and move_data["ply"] == len(board.undo_stack) + 1
+
+def fetch_events(session, site, server_ip, since):
+    """Long-poll the room's /events; returns its snapshot, or None when the server has no such endpoint."""
+    response = session.get(f"{site}{server_ip}/events", params={"since": since, "timeout": long_poll_timeout_sec},
+                           timeout=long_poll_timeout_sec + 10)
+    if response.status_code in (404, 405, 501):
+        return None
+    response.raise_for_status()
+    return response.json()
+
+def fetch_state(session, site, server_ip, version):
+    """Poll the room's batched /state; returns its snapshot, STATE_NOT_MODIFIED, or None when the server has no such endpoint."""
+    response = session.get(f"{site}{server_ip}/state", params={"since": version},
+                           headers={"If-None-Match": f'"{version}"'}, timeout=10)
+    if response.status_code == 304:
+        return STATE_NOT_MODIFIED
+    if response.status_code in (404, 405, 501):
+        return None
+    response.raise_for_status()
+    return response.json()
+
+class PollSchedule:
+    """Decides how long online_poller waits between polls.
+
+    Polls run every fast_sec while awaiting the opponent. Otherwise each poll that
+    finds nothing new doubles the wait from idle_sec up to max_sec, and errors back
+    off the same way from fast_sec. Waits are jittered so clients drift out of step,
+    and poke() ends the current wait at once.
+    """
+    def __init__(self, fast_sec, idle_sec, max_sec, jitter=0.2):
+        self.fast_sec = fast_sec
+        self.idle_sec = idle_sec
+        self.max_sec = max_sec
+        self.jitter = jitter
+        self.awaiting = False
+        self.interval_sec = fast_sec
+        self.poked = threading.Event()
+        self.lock = threading.Lock()
+        self.metrics = Counter()
+
+    def set_awaiting(self, awaiting):
+        # Set by the UI thread every frame; starting to await cuts a long idle wait short
+        if awaiting and not self.awaiting:
+            self.poke()
+        self.awaiting = awaiting
+
+    def poke(self):
+        with self.lock:
+            self.metrics["pokes"] += 1
+            self.interval_sec = self.fast_sec
+        self.poked.set()
+
+    def record(self, outcome):
+        """Count one poll ("changed", "unchanged" or "error") and pick the next interval from it."""
+        with self.lock:
+            self.metrics["polls"] += 1
+            self.metrics[outcome] += 1
+            if outcome == "error":
+                self.interval_sec = min(max(self.interval_sec, self.fast_sec) * 2, self.max_sec)
+            elif outcome == "changed" or self.awaiting:
+                self.interval_sec = self.fast_sec
+            elif self.interval_sec < self.idle_sec:
+                self.interval_sec = self.idle_sec
+            else:
+                self.interval_sec = min(self.interval_sec * 2, self.max_sec)
+
+    def wait(self, stop_event):
+        with self.lock:
+            delay_sec = self.interval_sec * random.uniform(1 - self.jitter, 1 + self.jitter)
+        deadline = time.monotonic() + delay_sec
+        while not stop_event.is_set():
+            remaining_sec = deadline - time.monotonic()
+            if remaining_sec <= 0:
+                return
+            if self.poked.wait(min(remaining_sec, 0.05)): # Short slices so a stop is noticed quickly
+                self.poked.clear()
+                return
+
+    def summary(self):
+        with self.lock:
+            counts = ", ".join(f"{name}={count}" for name, count in sorted(self.metrics.items()))
+            return f"{counts}, interval={self.interval_sec * 1000:.0f}ms (fast={self.fast_sec * 1000:.0f}ms, idle={self.idle_sec * 1000:.0f}ms, max={self.max_sec * 1000:.0f}ms)"
+
+poll_schedule = PollSchedule(poll_fast_ms / 1000, poll_idle_ms / 1000, poll_max_ms / 1000)
+
+def fetch_moves(session, site, server_ip, since):
+    """The room's moves after ply since, oldest first, or None when the server keeps no move log."""
+    response = session.get(f"{site}{server_ip}/moves", params={"since": since}, timeout=10)
+    if response.status_code in (404, 405, 501):
+        return None
+    response.raise_for_status()
+    return response.json()["moves"]
+
+def missed_since(move, last_move):
+    # The ply after which moves were skipped before move arrived, or None when nothing was.
+    # Moves carry their game number and ply; a move from another game restarts the count.
+    if not move or "ply" not in move:
+        return None
+    if last_move and "ply" in last_move and last_move.get("game") == move.get("game"):
+        since = last_move["ply"]
+    else:
+        since = 0
+    return since if move["ply"] > since + 1 else None
+
+def moves_before(moves, move):
+    # The entries of a /moves reply that belong before move in the same game
+    return [earlier for earlier in moves or [] if earlier.get("game") == move.get("game") and earlier["ply"] < move["ply"]]
+
+def report_change(q, data, last_data, label):
+    # Queue data only when it differs from what was last reported, and wake the UI thread for it
+    if data != last_data:
+        print(f"[PollerThread] New {label} detected: {data}")
+        q.put(data)
+        wake_main_thread()
+    return data
+
+def report_move(session, site, server_ip, q, move, last_move):
+    # Like report_change, but first recovers any plies the poller skipped from the room's move log
+    since = missed_since(move, last_move)
+    if since is not None:
+        for missed_move in moves_before(fetch_moves(session, site, server_ip, since), move):
+            print(f"[PollerThread] Recovered missed move: {missed_move}")
+            q.put(missed_move)
+    return report_change(q, move, last_move, "move")
+
+def record_poll(schedule, failed, last_seen, seen):
+    schedule.record("error" if failed else "changed" if seen != last_seen else "unchanged")
+
+def online_poller(session, site, server_ip, stop_event, move_q, offer_q, players_q, schedule, initial_last_move, initial_last_offer, initial_last_players):
 
     current_last_move = initial_last_move
     current_last_offer = initial_last_offer
     current_last_players = initial_last_players
+    use_events = True # Switched off for good once the server turns out not to have /events
+    events_seq = -1 # Below any real sequence number, so the first long poll answers at once
+    use_state = True # Likewise for /state, after which each resource is polled on its own
+    state_version = -1
     while not stop_event.is_set():
-        next_poll_time = time.monotonic() + poll_interval_sec
+        last_seen = (current_last_players, current_last_move, current_last_offer)
+        if use_events:
+            try:
+                events = fetch_events(session, site, server_ip, events_seq)
+                if stop_event.is_set():
+                    break # Stopped during the long poll: this room's news must not reach the next room's game
+                if events is None:
+                    print("[PollerThread] Server has no /events endpoint, falling back to polling")
+                    use_events = False
+                    continue
+                current_last_players = report_change(players_q, events["players"], current_last_players, "player data")
+                current_last_move = report_move(session, site, server_ip, move_q, events["move"], current_last_move)
+                current_last_offer = report_change(offer_q, events["offer"], current_last_offer, "offer")
+                # Only now, so a failed /moves fetch gets the same snapshot again rather than waiting for a change
+                events_seq = events["seq"]
+                # The long poll itself did the waiting, so poll again straight away
+                record_poll(schedule, False, last_seen, (current_last_players, current_last_move, current_last_offer))
+            except requests.exceptions.RequestException as e:
+                print(f"[PollerThread] Network error waiting for events: {e}")
+                players_q.put("ERROR_DISCONNECTED") # Signal potential disconnect
+                wake_main_thread()
+                schedule.record("error")
+                schedule.wait(stop_event) # Don't hammer a server that is down
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"[PollerThread] Malformed events response: {e}")
+                schedule.record("error")
+                schedule.wait(stop_event)
+            continue
+
+        poll_failed = False
+        if use_state:
+            # One request for players, move and offer; an unchanged room answers 304 with no body
+            try:
+                state = fetch_state(session, site, server_ip, state_version)
+                if stop_event.is_set():
+                    break # Stopped while waiting; the queues may already belong to a new room
+                if state is None:
+                    print("[PollerThread] Server has no /state endpoint, polling each resource")
+                    use_state = False
+                    continue
+                if state is not STATE_NOT_MODIFIED:
+                    current_last_players = report_change(players_q, state["players"], current_last_players, "player data")
+                    current_last_move = report_move(session, site, server_ip, move_q, state["move"], current_last_move)
+                    current_last_offer = report_change(offer_q, state["offer"], current_last_offer, "offer")
+                    state_version = state["version"] # Not before: a 304 must never hide a move still unreported
+            except requests.exceptions.RequestException as e:
+                print(f"[PollerThread] Network error polling state: {e}")
+                players_q.put("ERROR_DISCONNECTED") # Signal potential disconnect
+                wake_main_thread()
+                poll_failed = True
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"[PollerThread] Malformed state response: {e}")
+                poll_failed = True
+            record_poll(schedule, poll_failed, last_seen, (current_last_players, current_last_move, current_last_offer))
+            schedule.wait(stop_event)
+            continue
+
         try:
             # --- Poll for players ---
             try:
                 players_response = session.get(f"{site}{server_ip}/players", timeout=5) # Shorter timeout for non-critical polls
                 players_response.raise_for_status() # Check for HTTP errors
                 players_data = players_response.json()
+                if stop_event.is_set():
+                    break
                 # Check if players_data is valid before queuing (e.g., is it a list?)
                 if players_data != current_last_players:
                     if isinstance(players_data, list):
                         players_q.put(players_data) # Put player list in queue
+                        wake_main_thread()
                         current_last_players = players_data
                         print(f"[PollerThread] Received player data: {players_data}")
                     else:
@@ -710,6 +755,8 @@ def online_poller(session, site, server_ip, stop_event, move_q, offer_q, players
             except requests.exceptions.RequestException as e:
                 print(f"[PollerThread] Network error polling players: {e}")
                 players_q.put("ERROR_DISCONNECTED") # Signal potential disconnect
+                wake_main_thread()
+                poll_failed = True
             except json.JSONDecodeError as e:
                 print(f"[PollerThread] JSON decode error polling players: {e}")
             except Exception as e:
@@ -721,14 +768,14 @@ def online_poller(session, site, server_ip, stop_event, move_q, offer_q, players
                 move_response = session.get(f"{site}{server_ip}/latest-move", timeout=10) # Longer timeout for critical move data
                 move_response.raise_for_status()
                 move_data = move_response.json() # Can be None/null
+                if stop_event.is_set():
+                    break
                 # Only put move in queue if it's new (different from last known)
                 # Handles case where server sends null initially or after reset
-                if move_data != current_last_move:
-                    print(f"[PollerThread] New move detected: {move_data}")
-                    current_last_move = move_data # Update local state for comparison
-                    move_q.put(move_data)
+                current_last_move = report_move(session, site, server_ip, move_q, move_data, current_last_move)
             except requests.exceptions.RequestException as e:
                 print(f"[PollerThread] Network error polling move: {e}")
+                poll_failed = True
                 # Consider if move errors should also signal disconnect
             except json.JSONDecodeError as e:
                 print(f"[PollerThread] JSON decode error polling move: {e}")
@@ -740,13 +787,17 @@ def online_poller(session, site, server_ip, stop_event, move_q, offer_q, players
                 offer_response = session.get(f"{site}{server_ip}/latest-offer", timeout=10)
                 offer_response.raise_for_status()
                 offer_data = offer_response.json() # Can be None/null
+                if stop_event.is_set():
+                    break
                 # Only put offer in queue if it's new (different from last known)
                 if offer_data != current_last_offer:
                     print(f"[PollerThread] New offer detected: {offer_data}")
                     current_last_offer = offer_data # Update local state for comparison
                     offer_q.put(offer_data)
+                    wake_main_thread()
             except requests.exceptions.RequestException as e:
                 print(f"[PollerThread] Network error polling offer: {e}")
+                poll_failed = True
             except json.JSONDecodeError as e:
                  print(f"[PollerThread] JSON decode error polling offer: {e}")
             except Exception as e:
@@ -757,19 +808,268 @@ def online_poller(session, site, server_ip, stop_event, move_q, offer_q, players
             # Catch-all for safety within the outer try
             print(f"[PollerThread] Unexpected error during polling cycle: {e}")
 
-        # Wait until the next poll time, checking stop_event frequently
-        while time.monotonic() < next_poll_time and not stop_event.is_set():
-            time.sleep(0.05) # Sleep briefly
+        record_poll(schedule, poll_failed, last_seen, (current_last_players, current_last_move, current_last_offer))
+        schedule.wait(stop_event)
+    print(f"[PollerThread] Stopped; polls: {schedule.summary()}")
+
+def queue_send(method, path, payload):
+    """Hand a request to the sender without blocking the UI thread; returns its message id, or None if the queue is full."""
+    message_id = uuid.uuid4().hex
+    try:
+        send_queue.put_nowait((method, path, payload, message_id))
+    except Full:
+        print(f"Send queue full, dropping {method} /{path}")
+        return None
+    unacked_sends[message_id] = (path, time.monotonic())
+    return message_id
+
+def update_send_status():
+    # UI thread: settle the sender's acknowledgements and show a lagging or failed send in the title bar
+    global failed_send_path, window_caption
+    while True:
+        try:
+            message_id, status = ack_queue.get_nowait()
+        except Empty:
+            break
+        path, _ = unacked_sends.pop(message_id, (None, None))
+        if status == "failed":
+            failed_send_path = path
+        elif status == "delivered":
+            failed_send_path = None
+    now = time.monotonic()
+    lagging = [path for path, queued_at in unacked_sends.values() if now - queued_at > send_lag_sec]
+    if lagging:
+        caption = f"Chesspy - sending {lagging[0]}..."
+    elif failed_send_path:
+        caption = f"Chesspy - could not send {failed_send_path}"
+    else:
+        caption = "Chesspy"
+    if caption != window_caption:
+        pygame.display.set_caption(caption)
+        window_caption = caption
+
+def coalesce(outbox, request):
+    # The room keeps one offer and one player list, so a newer POST to either replaces the writes
+    # to it still waiting here (a repeated draw offer, say). A DELETE replaces nothing: clearing the
+    # opponent's offer must not drop our own resign or draw. Moves are all kept; each is a ply.
+    method, path = request[:2]
+    if method == "POST" and path in ("offer", "players"):
+        for waiting in [waiting for waiting in outbox if waiting[1] == path]:
+            outbox.remove(waiting)
+            ack_queue.put((waiting[3], "superseded"))
+    outbox.append(request)
+
+def deliver(session, site, server_ip, request, stop_event):
+    """Send one request, retrying timeouts, network errors, 408, 429 and 5xx with jittered backoff."""
+    method, path, payload, message_id = request
+    deadline = time.monotonic() + send_retry_deadline_sec
+    delay_sec = 0.5
+    while True:
+        try:
+            # The key lets a server recognise a retry of a request it already applied
+            response = session.request(method, f"{site}{server_ip}/{path}", json=payload,
+                                       headers={"Idempotency-Key": message_id}, timeout=send_timeout_sec)
+            if response.status_code < 500 and response.status_code not in (408, 429):
+                response.raise_for_status() # Any other 4xx won't get better by retrying
+                return "delivered"
+            error = f"HTTP {response.status_code}"
+        except requests.exceptions.HTTPError as e:
+            print(f"[SenderThread] Server rejected {method} /{path}: {e}")
+            return "failed"
+        except requests.exceptions.RequestException as e:
+            error = e
+        if stop_event.is_set() or time.monotonic() + delay_sec > deadline:
+            print(f"[SenderThread] Giving up on {method} /{path}: {error}")
+            return "failed"
+        print(f"[SenderThread] {method} /{path} failed ({error}), retrying in {delay_sec:.1f}s")
+        time.sleep(delay_sec * random.uniform(0.8, 1.2))
+        delay_sec = min(delay_sec * 2, 8)
 
 def online_sender(session, stop_event, send_q, site, server_ip):
-    while not stop_event.is_set():
+    # Every request the UI thread makes goes through here, in order, and each is acknowledged on
+    # ack_queue. Once stopped it still drains what is queued, so leaving a room is not lost.
+    outbox = deque() # Taken from send_q, waiting to be sent
+    while not (stop_event.is_set() and send_q.empty() and not outbox):
         try:
-            send_data = send_q.get(timeout=0.5)
-            if send_data:
-                response = session.post(f"{site}{server_ip}/move", json=send_data)
-                response.raise_for_status()
+            coalesce(outbox, send_q.get(timeout=0.5) if not outbox else send_q.get_nowait())
+            while True: # Gather the rest too, so anything already superseded is never sent
+                coalesce(outbox, send_q.get_nowait())
         except Empty:
             pass
+        if not outbox:
+            continue
+        request = outbox.popleft()
+        try:
+            status = deliver(session, site, server_ip, request, stop_event)
+        except Exception as e: # Never let one bad request end the thread and every send after it
+            print(f"[SenderThread] Unexpected error on {request[0]} /{request[1]}: {e}")
+            status = "failed"
+        ack_queue.put((request[3], status))
+        wake_main_thread()
+        if status == "delivered":
+            poll_schedule.poke() # Whatever we sent, the opponent's answer is worth fetching soon
+
+def settle_socket_request(unacked, unacked_lock, message_id, status):
+    # The server answered a frame we sent: pass its fate on to the UI thread
+    with unacked_lock:
+        for request in unacked:
+            if request[3] == message_id:
+                unacked.remove(request)
+                break
+        else:
+            return
+    ack_queue.put((message_id, status))
+    wake_main_thread()
+
+def read_socket_messages(websocket, stop_event, reported, unacked, unacked_lock, move_q, offer_q, players_q):
+    # Runs for one connection, blocked on it until the server pushes something or the connection closes
+    held_move = None # A pushed move waiting for the plies it skipped to arrive first
+    try:
+        for raw_message in websocket:
+            message = json.loads(raw_message)
+            if message.get("type") == "ack":
+                settle_socket_request(unacked, unacked_lock, message.get("id"), "delivered")
+            elif message.get("type") == "error":
+                print(f"[SocketThread] Server rejected a request: {message}")
+                settle_socket_request(unacked, unacked_lock, message.get("id"), "failed")
+                if held_move is not None and message.get("path") == "moves": # No move log; report what we have
+                    reported["move"] = report_change(move_q, held_move, reported["move"], "move")
+                    held_move = None
+            elif stop_event.is_set():
+                continue # Leaving this room; its news must not reach the next room's game
+            elif message.get("type") == "state":
+                reported["players"] = report_change(players_q, message["players"], reported["players"], "player data")
+                since = missed_since(message["move"], reported["move"])
+                if since is None:
+                    reported["move"] = report_change(move_q, message["move"], reported["move"], "move")
+                else:
+                    held_move = message["move"]
+                    websocket.send(json.dumps({"method": "GET", "path": "moves", "data": {"since": since}}))
+                reported["offer"] = report_change(offer_q, message["offer"], reported["offer"], "offer")
+            elif message.get("type") == "moves" and held_move is not None:
+                for missed_move in moves_before(message["moves"], held_move):
+                    print(f"[SocketThread] Recovered missed move: {missed_move}")
+                    move_q.put(missed_move)
+                reported["move"] = report_change(move_q, held_move, reported["move"], "move")
+                held_move = None
+    except (OSError, WebSocketException, ValueError, KeyError) as e:
+        if not stop_event.is_set():
+            print(f"[SocketThread] Stopped reading: {e}")
+
+def online_socket_worker(socket_site, server_ip, stop_event, send_q, move_q, offer_q, players_q):
+    # One persistent connection per room carries both directions. This thread sends requests from
+    # send_q as {"method", "path", "data", "id"} frames, and a reader thread per connection handles
+    # what the server pushes: the room's state whenever it changes, acknowledgements and replayed moves.
+    reported = {"players": None, "move": None, "offer": None} # Last values reported; outlives a reconnect
+    pending = None # Taken from send_q but not sent yet; survives a reconnect
+    unacked = [] # Sent but not acknowledged; resent after a reconnect, and the server skips ids it has applied
+    unacked_lock = threading.Lock()
+    reader = None
+    retry_delay_sec = 0.5
+    leave_by = [] # Once stopped: how long the last acknowledgements are waited for
+
+    def finished():
+        if not stop_event.is_set() or pending is not None or not send_q.empty():
+            return False
+        if not leave_by:
+            leave_by.append(time.monotonic() + 5)
+        with unacked_lock:
+            return not unacked or time.monotonic() > leave_by[0]
+
+    def send_request(websocket, request):
+        method, path, payload, message_id = request
+        websocket.send(json.dumps({"method": method, "path": path, "data": payload, "id": message_id}))
+
+    while not finished():
+        try:
+            with websocket_connect(f"{socket_site}{server_ip}/ws", open_timeout=10,
+                                   ping_interval=socket_heartbeat_sec, ping_timeout=socket_heartbeat_sec) as websocket:
+                retry_delay_sec = 0.5
+                if reader is not None:
+                    reader.join(timeout=2) # The last connection's reader, done once that connection closed
+                reader = threading.Thread(target=read_socket_messages,
+                                          args=(websocket, stop_event, reported, unacked, unacked_lock, move_q, offer_q, players_q),
+                                          daemon=True)
+                with unacked_lock:
+                    for request in unacked: # Frames the last connection may have lost, in their original order
+                        send_request(websocket, request)
+                reader.start()
+                while not finished():
+                    if not reader.is_alive():
+                        raise ConnectionError("the connection closed")
+                    if pending is None:
+                        try:
+                            pending = send_q.get(timeout=0.25) # Returns as soon as the UI queues something
+                        except Empty:
+                            continue
+                    with unacked_lock:
+                        send_request(websocket, pending)
+                        unacked.append(pending)
+                    pending = None
+        except (OSError, WebSocketException, ValueError, KeyError) as e:
+            if stop_event.is_set():
+                break # Leaving anyway; don't keep a closed window's process alive retrying
+            print(f"[SocketThread] Connection lost, reconnecting in {retry_delay_sec}s: {e}")
+            players_q.put("ERROR_DISCONNECTED") # Signal potential disconnect
+            wake_main_thread()
+            stop_event.wait(retry_delay_sec)
+            retry_delay_sec = min(retry_delay_sec * 2, 5)
+    for request in list(unacked):
+        print(f"[SocketThread] No acknowledgement for {request[0]} /{request[1]} before leaving")
+        settle_socket_request(unacked, unacked_lock, request[3], "failed")
+
+def create_online_room(session, site, player_color):
+    # Runs on its own thread: a cold-starting server can take most of a minute to answer
+    try:
+        room = random.randint(1000, 9999)
+        while session.get(f"{site}{room}/create", timeout=60).json()["message"] != "Room created":
+            room = random.randint(1000, 9999)
+        session.post(f"{site}{room}/players", json=[player_color], timeout=60).raise_for_status()
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print(f"Could not create a room: {e}")
+        room = None
+    room_created_queue.put(room)
+    wake_main_thread()
+
+def start_online_threads(session, site, server_ip, socket_site=None):
+    global polling_thread, sender_thread, poller_stop_event, sender_stop_event
+    if socket_site:
+        # One worker does both jobs over the room WebSocket, so both names point at it
+        if sender_thread is None or not sender_thread.is_alive() or sender_stop_event.is_set():
+            poller_stop_event = sender_stop_event = threading.Event()
+            polling_thread = sender_thread = threading.Thread(target=online_socket_worker,
+                                            args=(socket_site, server_ip, sender_stop_event, send_queue,
+                                                    opponent_move_queue, offer_queue, player_status_queue),
+                                            daemon=True)
+            sender_thread.start()
+        return
+    # A stopped worker may still be finishing a long poll or a request, so it gets replaced, not reused
+    if polling_thread is None or not polling_thread.is_alive() or poller_stop_event.is_set():
+        poller_stop_event = threading.Event()
+        # Pass initial last_move, offer and players state as None so the first poll reports them
+        polling_thread = threading.Thread(target=online_poller,
+                                        args=(session, site, server_ip, poller_stop_event,
+                                                opponent_move_queue, offer_queue, player_status_queue,
+                                                poll_schedule, None, None, None),
+                                        daemon=True)
+        polling_thread.start()
+    if sender_thread is None or not sender_thread.is_alive() or sender_stop_event.is_set():
+        sender_stop_event = threading.Event()
+        sender_thread = threading.Thread(target=online_sender,
+                                        args=(session, sender_stop_event, send_queue, site, server_ip),
+                                        daemon=True)
+        sender_thread.start()
+
+def leave_online_room(session, site, server_ip, cleanup):
+    # Called after the window is closed, so waiting for the last requests freezes nothing
+    for request in cleanup:
+        queue_send(*request)
+    poller_stop_event.set()
+    sender_stop_event.set()
+    if sender_thread is not None and sender_thread.is_alive():
+        sender_thread.join(timeout=5)
+    else:
+        online_sender(session, sender_stop_event, send_queue, site, server_ip)
 
 
 
@@ -780,42 +1080,41 @@ def main():
     pygame.font.init() # Ensure font module is initialized
     pygame.mixer.init() # Initialize sound mixer
     session = Session()
-    try:
-        move_sound = pygame.mixer.Sound(resource_path("assets/move.mp3")) # Load move sound
-    except pygame.error as e:
-        print(f"Could not load sound file: {e}")
-    try:
-        capture_sound = pygame.mixer.Sound(resource_path("assets/capture.mp3")) # Load capture sound
-    except pygame.error as e:
-        print(f"Could not load sound file: {e}")
     screen = pygame.display.set_mode((800, 600))
     pygame.display.set_caption("Chesspy")
+    # Sounds and the piece atlas load in the background while the mode-select screen runs
+    asset_loader = AssetLoader(int(size))
+    piece_sprites.loader = asset_loader
+    board_view = BoardView()
     
     
     # --- Font for Setup ---
-    setup_font = pygame.font.Font(None, 48)
-    input_font = pygame.font.Font(None, 36)
+    setup_font_size = 48
+    input_font_size = 36
     input_box = pygame.Rect(200, 200, 400, 40) # Position for IP input
     input_text = ''
     input_active = False
     display_ip_message = "" # To show host's IP
-    site = "https://chess-server-5mll.onrender.com/"
+    site = os.environ.get("CHESSPY_SERVER", "https://chess-server-5mll.onrender.com/") # e.g. a local standin_server.py
+    socket_site = os.environ.get("CHESSPY_SOCKET_SERVER") # ws:// base URL; set to play over a room WebSocket
+    if socket_site and websocket_connect is None:
+        print("CHESSPY_SOCKET_SERVER is set but websockets 15 or newer is not installed; using HTTP.")
+        socket_site = None
     game_state = "setup" # New initial state
 
-    last_poll_time = 0
-    last_move_poll_time = 0
-    last_connection_poll_time = 0
-    poll_interval_ms = 100 # Check ~10 times per second (1000ms / 10Hz)
+    clock = pygame.time.Clock()
     while True:
-        pygame.time.Clock().tick(30) # Limit FPS during setup
+        clock.tick(frame_rate)
+        update_send_status()
         if game_state == "setup":
             setup_message = "Choose: Online (O) or Local (L)"
             ip_prompt = "Enter Host IP:"
             bottom_message = ""
             board = Board()
+            game_number = 1 # Counted by both players, so a move names the game it belongs to
             selected_piece = None
             turn = "W"
-            board_states = [deepcopy(board.pieces)]
+            board_states = Counter([board.zobrist_key])
             fifty_move_rule = 0
             promotion_handler = None
             gameover_handler = None
@@ -832,7 +1131,8 @@ def main():
             local_enter_pressed = False
 
             screen.fill((30, 30, 30))
-            text_surface = setup_font.render(setup_message, True, (255, 255, 255))
+            board_view.invalidate()
+            text_surface = render_text(setup_message, setup_font_size, (255, 255, 255))
             text_rect = text_surface.get_rect(center=(400, 150))
             screen.blit(text_surface, text_rect)
             pygame.display.update() 
@@ -855,71 +1155,63 @@ def main():
         elif game_state == "online_setup":
             ip_prompt = "Enter Room Code:"
             screen.fill((30, 30, 30)) # Dark background
-            text_surface = setup_font.render(setup_message, True, (255, 255, 255))
+            board_view.invalidate()
+            text_surface = render_text(setup_message, setup_font_size, (255, 255, 255))
             text_rect = text_surface.get_rect(center=(400, 150))
-            bottom_message_surface = setup_font.render(bottom_message, True, (255, 255, 255))
+            bottom_message_surface = render_text(bottom_message, setup_font_size, (255, 255, 255))
             bottom_message_rect = bottom_message_surface.get_rect(center=(400, 300))
             screen.blit(bottom_message_surface, bottom_message_rect)
 
             if input_active: # Still need to enter IP
                 setup_message = ""
-                prompt_surf = input_font.render(ip_prompt, True, (255, 255, 255))
+                prompt_surf = render_text(ip_prompt, input_font_size, (255, 255, 255))
                 prompt_rect = prompt_surf.get_rect(midbottom=(400, input_box.top - 10))
                 screen.blit(prompt_surf, prompt_rect)
 
                 pygame.draw.rect(screen, (200, 200, 200) if input_active else (100, 100, 100), input_box, 2)
-                input_surface = input_font.render(input_text, True, (255, 255, 255))
+                input_surface = render_text(input_text, input_font_size, (255, 255, 255))
                 screen.blit(input_surface, (input_box.x + 5, input_box.y + 5))
                 input_box.w = max(400, input_surface.get_width() + 10)
             else: # Draw the B/W choice message only if not asking for IP
                 screen.blit(text_surface, text_rect)
 
+            if setup_message == "Creating room...":
+                try:
+                    server_ip = room_created_queue.get_nowait()
+                    if server_ip is None:
+                        server_ip = ""
+                        setup_message = "Create Room (C) or Join Room (J)"
+                        bottom_message = "Server unavailable"
+                    else:
+                        players = [player_color]
+                        setup_message = "Waiting for opponent..."
+                        bottom_message = f"Room Code: {server_ip}"
+                except Empty:
+                    pass
+
             if setup_message == "Waiting for opponent...":
-                current_time = pygame.time.get_ticks()
-                if current_time - last_poll_time >= 50:
-                    last_poll_time = current_time
-                    try:
-                        response = session.get(f"{site}{server_ip}/players")
-                        server_players = response.json()
-                        if len(server_players) == 2:
-                            # --- Start Polling Thread ---
-                            print("test1")
-                            if polling_thread is None or not polling_thread.is_alive():
-                                poller_stop_event.clear()
-                                # Pass initial last_move state (should be None at game start)
-                                # Pass initial offer state (None)
-                                
-                                polling_thread = threading.Thread(target=online_poller,
-                                                                args=(session, site, server_ip, poller_stop_event,
-                                                                        opponent_move_queue, offer_queue, player_status_queue,
-                                                                        poll_interval_ms / 1000.0, # Convert ms to seconds
-                                                                        None, None, None), # Pass None initially
-                                                                daemon=True)
-                                polling_thread.start()
-                            if sender_thread is None or not sender_thread.is_alive():
-                                sender_stop_event.clear()
-                                sender_thread = threading.Thread(target=online_sender,
-                                                                args=(session, sender_stop_event, send_queue, site, server_ip),
-                                                                daemon=True)
-                                sender_thread.start()
-                            print("test2")
-                            print("Game state set to normal")
-                            game_state = "normal"
-                    except:
-                        pass
+                # The poller reports the room's players; the game starts once both have joined
+                start_online_threads(session, site, server_ip, socket_site)
+                poll_schedule.set_awaiting(False) # Joining can take a while; back off until it happens
+                try:
+                    server_players = player_status_queue.get_nowait()
+                except Empty:
+                    server_players = None
+                if isinstance(server_players, list):
+                    players = server_players
+                    if len(server_players) == 2:
+                        print("Game state set to normal")
+                        game_state = "normal"
 
             pygame.display.update()
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    if server_ip != "":
-                        response = session.delete(f"{site}{server_ip}/players")
-                        response = session.get(f"{site}{server_ip}/delete")
-                        poller_stop_event.set()
-                        sender_stop_event.set()
                     pygame.quit()
+                    if server_ip != "":
+                        leave_online_room(session, site, server_ip, [("DELETE", "players", None), ("GET", "delete", None)])
                     return
-                elif event.type == pygame.KEYDOWN and not input_active:
+                elif event.type == pygame.KEYDOWN and not input_active and setup_message != "Creating room...":
                     if event.key == pygame.K_j:
                         player_color = "B"
                         my_turn = False
@@ -927,21 +1219,15 @@ def main():
                     elif event.key == pygame.K_c:
                         player_color = "W"
                         my_turn = True
-                        server_ip = random.randint(1000, 9999)
-                        response = session.get(f"{site}{server_ip}/create")
-                        while response.json()["message"] != "Room created":
-                            server_ip = random.randint(1000, 9999)
-                            response = session.get(f"{site}{server_ip}/create")
-                        setup_message = "Waiting for opponent..."
-                        bottom_message = f"Room Code: {server_ip}"
-                        players.append(player_color)
-                        response = session.post(f"{site}{server_ip}/players", json=players)
+                        setup_message = "Creating room..."
+                        bottom_message = ""
+                        threading.Thread(target=create_online_room, args=(session, site, player_color), daemon=True).start()
 
                 elif event.type == pygame.KEYDOWN and input_active:
                     if event.key == pygame.K_RETURN:
                         server_ip = input_text
-                        response = session.get(f"{site}{server_ip}/players")
                         try:
+                            response = session.get(f"{site}{server_ip}/players", timeout=10)
                             server_players = response.json()
                             if len(server_players) >= 2 or server_players.count(player_color) >= 1:
                                 bottom_message = "Room is full"
@@ -952,7 +1238,7 @@ def main():
                                 players.append(player)
                             players.append(player_color)
                             ### send players to server
-                            response = session.post(f"{site}{server_ip}/players", json=players)
+                            response = session.post(f"{site}{server_ip}/players", json=players, timeout=10)
                             input_active = False
                             setup_message = "Waiting for opponent..."
                             bottom_message = ""
@@ -969,7 +1255,8 @@ def main():
 
         elif game_state == "local_setup":
             screen.fill((30, 30, 30)) # Dark background
-            text_surface = setup_font.render(setup_message, True, (255, 255, 255))
+            board_view.invalidate()
+            text_surface = render_text(setup_message, setup_font_size, (255, 255, 255))
             text_rect = text_surface.get_rect(center=(400, 150))
             screen.blit(text_surface, text_rect)
         
@@ -979,12 +1266,12 @@ def main():
                 if not client_connected_event.is_set():
                     # Display Host's IP while waiting
                     if display_ip_message:
-                        ip_surf = input_font.render(display_ip_message, True, (200, 200, 200))
+                        ip_surf = render_text(display_ip_message, input_font_size, (200, 200, 200))
                         ip_rect = ip_surf.get_rect(center=(400, 250))
                         screen.blit(ip_surf, ip_rect)
 
                     # Keep displaying the waiting message
-                    text_surface = setup_font.render(setup_message, True, (255, 255, 255))
+                    text_surface = render_text(setup_message, setup_font_size, (255, 255, 255))
                     text_rect = text_surface.get_rect(center=(400, 150))
                     screen.blit(text_surface, text_rect)
                 else:
@@ -997,24 +1284,24 @@ def main():
             # --- Join Specific Logic during Setup ---
             elif is_host is False:
                 if not opponent_ip: # Still need to enter IP
-                    prompt_surf = input_font.render(ip_prompt, True, (255, 255, 255))
+                    prompt_surf = render_text(ip_prompt, input_font_size, (255, 255, 255))
                     prompt_rect = prompt_surf.get_rect(midbottom=(400, input_box.top - 10))
                     screen.blit(prompt_surf, prompt_rect)
 
                     pygame.draw.rect(screen, (200, 200, 200) if input_active else (100, 100, 100), input_box, 2)
-                    input_surface = input_font.render(input_text, True, (255, 255, 255))
+                    input_surface = render_text(input_text, input_font_size, (255, 255, 255))
                     screen.blit(input_surface, (input_box.x + 5, input_box.y + 5))
                     input_box.w = max(400, input_surface.get_width() + 10) # Resize box
                 else: # IP entered, waiting for first move (already set game_state=normal)
                     game_state = "normal"
-                    text_surface = setup_font.render(setup_message, True, (255, 255, 255))
+                    text_surface = render_text(setup_message, setup_font_size, (255, 255, 255))
                     text_rect = text_surface.get_rect(center=(400, 150))
                     screen.blit(text_surface, text_rect)
 
             # --- Initial Choice (Host/Join) Logic ---
             elif is_host is None:
                 # Display setup message
-                text_surface = setup_font.render(setup_message, True, (255, 255, 255))
+                text_surface = render_text(setup_message, setup_font_size, (255, 255, 255))
                 text_rect = text_surface.get_rect(center=(400, 150))
                 screen.blit(text_surface, text_rect)
 
@@ -1022,7 +1309,8 @@ def main():
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     if http_server:
-                        http_server.shutdown() # Attempt graceful shutdown
+                        stop_server(http_server)
+                    lan_link.close()
                     pygame.quit()
                     
                     return
@@ -1040,6 +1328,7 @@ def main():
                             player_color = "W"
                             http_server = start_server()
                             if http_server:
+                                lan_link.listen(lan_link_port) # Without it the game still runs over HTTP
                                 try: # Get local IP to display
                                     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
                                     s.connect(("8.8.8.8", 80)) # Connect to external server to find outgoing IP
@@ -1088,6 +1377,7 @@ def main():
                             if send_connection_ping(temp_ip, 8000):
                                 # Success!
                                 opponent_ip = temp_ip # Set the global opponent_ip
+                                lan_link.connect(opponent_ip, lan_link_port) # Falls back to HTTP if the host has no link
                                 input_active = False
                                 game_state = "normal" # Start the game loop, waiting for first move
                                 setup_message = "Connected! Waiting for White's move..." # Update status
@@ -1117,8 +1407,9 @@ def main():
 
 
         elif game_state == "normal" or game_state == "gameover" or game_state == "promotion_pending":
+            # Only blocks if a game starts before the background loading has finished
+            move_sound, capture_sound = asset_loader.wait().move_sound, asset_loader.capture_sound
             # --- Check for incoming moves ---
-            current_time = pygame.time.get_ticks()
 
 
             if not my_turn and game_state == "normal": # Only process if it's opponent's turn and game is running
@@ -1136,59 +1427,22 @@ def main():
                         # Potentially set an error state in the game
                 else:
                     try:
-                        response = session.get(f"{site}{server_ip}/latest-move")
-                        move_data = response.json()
-                        if move_data and move_data != last_move:
-                            if current_time - last_move_poll_time >= poll_interval_ms:
-                                    last_move_poll_time = current_time
-                                    print(f"Processing move from server: {move_data}")
-                                    my_turn, turn, fifty_move_rule, drawed, board_states, last_move = do_move(move_data, board, my_turn, turn, fifty_move_rule, drawed, board_states, last_move)
+                        move_data = opponent_move_queue.get_nowait() # Filled by the poller thread
+                        # The poller also reports our own move echoed back by the server
+                        if is_next_move(move_data, board, game_number, last_move):
+                            print(f"Processing move from server: {move_data}")
+                            my_turn, turn, fifty_move_rule, drawed, board_states, last_move = do_move(move_data, board, my_turn, turn, fifty_move_rule, drawed, board_states, last_move)
+                    except Empty:
+                        pass # No move received yet
                     except Exception as e:
                         print(f"Error processing move from server: {e}")
                         # Potentially set an error state in the game
 
-            # --- Drawing ---
-            screen.fill((0, 0, 0))
-            board.draw(screen,player_color, selected_piece, last_move)
-            if game_state == "promotion_pending":
-                if promotion_handler: # Check if handler exists
-                    promotion_handler.draw(screen)
-            if game_state == "gameover":
-                if gameover_handler: # Check if handler exists
-                    gameover_handler.draw(screen)
-            if len(drawed) != 0:
-                board.side_menu.highlight_draw(screen)
-            pygame.display.update() # Use update for potentially smaller screen area changes
-
-            if board.valid_moves(turn) == []:
-                game_state = "gameover"
-                if board.is_in_check(turn):
-                    winner = "Black" if turn == "W" else "White"
-                    gameover_handler = Gameover(f"{winner} wins by checkmate")
-                else:
-                    gameover_handler = Gameover(f"Stalemate")
-
-            if len(board.pieces) == 2:
-                game_state = "gameover"
-                gameover_handler = Gameover("Draw by insufficient material")
-            elif len(board.pieces) == 3 and (board.piece_pos("B","W") != None or board.piece_pos("B","B") != None or board.piece_pos("N","W") != None or board.piece_pos("N","B") != None):
-                game_state = "gameover"
-                gameover_handler = Gameover("Draw by insufficient material")
-            elif len(board.pieces) == 4 and ((board.piece_pos("B","W") != None and board.piece_pos("B","B") != None) or (board.piece_pos("N","W") != None and board.piece_pos("N","B") != None)):
-                game_state = "gameover"
-                gameover_handler = Gameover("Draw by insufficient material")
-            elif len(board.pieces) == 4 and ((board.piece_pos("B","W") != None and board.piece_pos("N","B") != None) or (board.piece_pos("N","W") != None and board.piece_pos("B","B") != None)):
-                game_state = "gameover"
-                gameover_handler = Gameover("Draw by insufficient material")
-
-            for state in board_states:
-                if board_states.count(state) == 3:
-                    game_state = "gameover"
-                    gameover_handler = Gameover("Draw by repetition")
-
-            if fifty_move_rule == 100:
+            game_over = game_over_message(board, turn, board_states, fifty_move_rule)
+            if game_over is not None:
                 game_state = "gameover"
-                gameover_handler = Gameover("Draw by fifty move rule")
+                if gameover_handler is None or gameover_handler.message != game_over: # Keep the rendered panel
+                    gameover_handler = Gameover(game_over)
 
             if online:
                 if game_state != "gameover":
@@ -1201,7 +1455,7 @@ def main():
                             resigned = offer['color']
                         elif offer['type'] == "draw":
                             drawed.add(offer['color'])
-                        response = session.delete(f"{site}{server_ip}/offer")
+                        queue_send("DELETE", "offer", None)
                 try:
                     server_players = player_status_queue.get_nowait()
                 except Empty:
@@ -1210,6 +1464,8 @@ def main():
                     server_players = []
                 if server_players != None:
                     players = server_players
+                # Poll fast only while the opponent owes us a move or an answer to our draw offer
+                poll_schedule.set_awaiting(game_state == "normal" and (not my_turn or player_color in drawed))
                 if len(players)  < 2:
                     print("Opponent disconnected.") # Add console log
                     poller_stop_event.set()
@@ -1240,26 +1496,24 @@ def main():
                 last_move = None
                 selected_piece = None
                 
-                current_time = pygame.time.get_ticks()
-                if current_time - last_poll_time >= poll_interval_ms and online:
-                    last_poll_time = current_time
+                if online:
                     try:
-                        response = session.get(f"{site}{server_ip}/latest-offer")
-                        offer = response.json()
-                        if offer != None and offer['type'] == "play_again" and offer['color'] != player_color:
-                            play_again_active = True
-                            response = session.delete(f"{site}{server_ip}/offer")
-                    except Exception as e:
-                        continue
+                        offer = offer_queue.get_nowait()
+                    except Empty:
+                        offer = None
+                    if offer != None and offer['type'] == "play_again" and offer['color'] != player_color:
+                        play_again_active = True
+                        queue_send("DELETE", "offer", None)
             
                 if play_again_active or local_enter_pressed:
                     if not online and not play_again.is_set():
                         send_offer(opponent_ip, 8000, "play_again", player_color)
                     elif online and local_enter_pressed:
-                        response = session.post(f"{site}{server_ip}/offer", json={"type": "play_again", "color": player_color})
+                        queue_send("POST", "offer", {"type": "play_again", "color": player_color})
                     game_state = "normal"
                     board = Board()
-                    board_states = [deepcopy(board.pieces)]
+                    game_number += 1
+                    board_states = Counter([board.zobrist_key])
                     fifty_move_rule = 0
                     promotion_handler = None
                     gameover_handler = None
@@ -1274,20 +1528,40 @@ def main():
                     local_enter_pressed = False
                     play_again_active = False
                     if online:
-                        response = session.delete(f"{site}{server_ip}/move")
+                        queue_send("DELETE", "move", None)
+                        # Moves from the finished game are stale now, but the opponent may have started this one
+                        queued_moves = []
+                        while not opponent_move_queue.empty():
+                            queued_moves.append(opponent_move_queue.get_nowait())
+                        for move_data in queued_moves:
+                            if move_data and move_data.get("game") == game_number:
+                                opponent_move_queue.put(move_data)
 
-            for event in pygame.event.get():
+            # --- Drawing ---
+            overlays = []
+            if game_state == "promotion_pending":
+                if promotion_handler: # Check if handler exists
+                    overlays.append(promotion_handler)
+            if game_state == "gameover":
+                if gameover_handler: # Check if handler exists
+                    overlays.append(gameover_handler)
+            dirty_rects = board_view.draw(screen, board, player_color, selected_piece, last_move, overlays, len(drawed) != 0)
+            if dirty_rects:
+                pygame.display.update(dirty_rects) # Only the squares that changed this frame
+                events = pygame.event.get()
+            else:
+                # Nothing changed on screen: sleep until input, a network wake-up or the idle timeout
+                events = [pygame.event.wait(idle_timeout_ms)] + pygame.event.get()
+
+            for event in events:
                 if event.type == pygame.QUIT:
                     if http_server:
-                        http_server.shutdown()
+                        stop_server(http_server)
+                    lan_link.close()
                     pygame.quit()
                     if online:
-                        response = session.delete(f"{site}{server_ip}/players")
-                        response = session.delete(f"{site}{server_ip}/move")
-                        response = session.delete(f"{site}{server_ip}/offer")
-                        response = session.get(f"{site}{server_ip}/delete")
-                        poller_stop_event.set()
-                        sender_stop_event.set()
+                        leave_online_room(session, site, server_ip, [("DELETE", "players", None), ("DELETE", "move", None),
+                                                                     ("DELETE", "offer", None), ("GET", "delete", None)])
                     return
 
                 if event.type == pygame.KEYDOWN and event.key == pygame.K_RETURN and game_state == "gameover":
@@ -1295,20 +1569,20 @@ def main():
                     
                 if event.type == pygame.MOUSEBUTTONDOWN and game_state != "gameover":
                     mouse_x, mouse_y = pygame.mouse.get_pos()
-                    if board.side_menu.resign_button.collidepoint(mouse_x, mouse_y):
+                    if board_view.side_menu.resign_button.collidepoint(mouse_x, mouse_y):
                         resigned = player_color
                         if my_turn != None and not online:
                             send_offer(opponent_ip, 8000, "resign", player_color)
                         elif online:
                             print(f"Sending resign offer to server")
-                            response = session.post(f"{site}{server_ip}/offer", json={"type": "resign", "color": player_color})
+                            queue_send("POST", "offer", {"type": "resign", "color": player_color})
                         continue
-                    elif board.side_menu.draw_button.collidepoint(mouse_x, mouse_y):
+                    elif board_view.side_menu.draw_button.collidepoint(mouse_x, mouse_y):
                         drawed.add(player_color)
                         if my_turn != None and not online:
                             send_offer(opponent_ip, 8000, "draw", player_color)
                         elif online:
-                            response = session.post(f"{site}{server_ip}/offer", json={"type": "draw", "color": player_color})
+                            queue_send("POST", "offer", {"type": "draw", "color": player_color})
                         continue
 
 
@@ -1331,8 +1605,10 @@ def main():
                                 if not online:
                                     send_move(opponent_ip, 8000, move_data)
                                 else:
-                                    send_queue.put(move_data)
-                                selected_piece.piece = choice
+                                    queue_send("POST", "move", move_data)
+                                board_states[board.zobrist_key] -= 1
+                                board.promote(selected_piece, choice)
+                                board_states[board.zobrist_key] += 1
                                 selected_piece = None
                                 if my_turn != None:
                                     my_turn = not my_turn
@@ -1360,14 +1636,16 @@ def main():
                             col = 7 - col
                             row = 7 - row
                         if selected_piece != None:
-                            if board.valid_moves(selected_piece.color).count((selected_piece,col,row)) > 0:
+                            if (col, row) in board.moves_from(selected_piece.x, selected_piece.y):
                                 move_data = {
                                         'from_x': selected_piece.x,
                                         'from_y': selected_piece.y,
                                         'to_x': col,
                                         'to_y': row,
                                         'promotion': None, # Default to no promotion
-                                        'fifty_move': fifty_move_rule # Include current rule state
+                                        'fifty_move': fifty_move_rule, # Include current rule state
+                                        'game': game_number,
+                                        'ply': len(board.undo_stack) + 1 # Lets the opponent notice a skipped move
                                     }
 
                                 print(f"selected_piece.piece: {selected_piece.piece} {row}")
@@ -1384,14 +1662,14 @@ def main():
                                     if not online:
                                         send_move(opponent_ip, 8000, move_data)
                                     else:
-                                        send_queue.put(move_data)
+                                        queue_send("POST", "move", move_data)
 
                                                             
                             selected_piece = None # Clear the selected piece variable
                                     
-                        for piece in board.pieces:
-                            if piece.x == col and piece.y == row and piece.color == turn:
-                                selected_piece = piece
+                        piece = board.piece_at(col, row)
+                        if piece != None and piece.color == turn:
+                            selected_piece = piece
                     else:
                         # Click was outside the board, deselect any selected piece
                         selected_piece = None
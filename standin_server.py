@@ -0,0 +1,341 @@
+"""Local stand-in for the online room server, for playing and testing offline.
+
+Implements the endpoints the client uses, per room code:
+
+    GET    /<room>/create            {"message": "Room created"} or "Room already exists"
+    GET    /<room>/delete            drop the room
+    GET    /<room>/players           list of player colors
+    POST   /<room>/players           replace the player list
+    DELETE /<room>/players           clear the player list
+    GET    /<room>/latest-move       last posted move, or null
+    POST   /<room>/move              post a move; one with a "ply" also goes in the
+                                     room's move log, replacing any logged moves from
+                                     that ply on (so ply 1 starts a new game's log);
+                                     reposting a logged move changes nothing
+    DELETE /<room>/move              clear the move
+    GET    /<room>/moves?since=N     {"moves": logged moves after ply N, "ply": last ply}
+    GET    /<room>/latest-offer      last posted offer, or null
+    POST   /<room>/offer             post an offer
+    DELETE /<room>/offer             clear the offer
+    GET    /<room>/events?since=N    long poll: waits until the room's sequence
+                                     number passes N (or `timeout` seconds), then
+                                     returns {"seq", "players", "move", "offer"}
+    GET    /<room>/state?since=N     the room's {"version", "players", "move",
+                                     "offer"} in one response, or 304 Not Modified
+                                     with no body while the version is still N
+                                     (If-None-Match: "N" works the same way)
+
+With --websocket-port it also serves ws://host:port/<room>/ws from an asyncio
+server sharing the same rooms. Clients send {"method", "path", "data"} frames
+carrying the same requests as above, and the server pushes
+{"type": "state", "seq", "players", "move", "offer"} whenever the room changes.
+A {"method": "GET", "path": "moves", "data": {"since": N}} frame is answered
+with {"type": "moves", "moves", "ply"}. A frame with an "id" is answered with
+{"type": "ack", "id"} once applied, or an error frame carrying the same id.
+That part needs the optional `websockets` package.
+
+Requests may carry an Idempotency-Key header (an "id" on WebSocket frames); a
+repeat of a key already seen gets the first reply and changes nothing.
+
+Run it with `python standin_server.py --port 8080` and point the game at it with
+CHESSPY_SERVER=http://localhost:8080/.
+"""
+import argparse
+import asyncio
+import http.server
+import json
+import threading
+import urllib.parse
+
+try:
+    from websockets.asyncio.server import serve as websocket_serve
+    from websockets.exceptions import ConnectionClosed
+except ImportError: # Optional: only needed for --websocket-port
+    websocket_serve = None
+
+MAX_LONG_POLL_SEC = 30
+MAX_REMEMBERED_REPLIES = 1024 # Idempotency keys kept for answering retries
+# Room fields each path reads or writes
+FIELDS = {"players": "players", "latest-move": "move", "move": "move", "latest-offer": "offer", "offer": "offer"}
+
+
+class Rooms:
+    """Room state shared by every connection; each change bumps the room's seq and wakes waiters."""
+    def __init__(self):
+        self.rooms = {}
+        self.changed = threading.Condition()
+        self.listeners = set() # Called with no arguments after every change, under the lock
+        self.replies = {} # Idempotency key -> (status, body) of a request already applied, oldest first
+
+    def notify(self):
+        self.changed.notify_all()
+        for listener in list(self.listeners):
+            listener()
+
+    def snapshot(self, code):
+        # A deleted or unknown room reads as an empty one, which clients treat as the opponent leaving
+        room = self.rooms.get(code)
+        if room is None:
+            return {"seq": 0, "players": [], "move": None, "offer": None}
+        return {"seq": room["seq"], "players": room["players"], "move": room["move"], "offer": room["offer"]}
+
+    def request(self, code, method, action, data=None, key=None):
+        """Apply one client request to a room and return (status, response body).
+
+        A request carrying the key of one already applied is a retry: it gets the
+        first reply again and changes nothing.
+        """
+        with self.changed:
+            if key is not None and key in self.replies:
+                return self.replies[key]
+            reply = self.apply(code, method, action, data)
+            if key is not None:
+                self.replies[key] = reply
+                if len(self.replies) > MAX_REMEMBERED_REPLIES:
+                    del self.replies[next(iter(self.replies))]
+            return reply
+
+    def apply(self, code, method, action, data):
+        # Called by request() with the lock held
+        if method == "GET" and action == "create":
+            if code in self.rooms:
+                return 200, {"message": "Room already exists"}
+            self.rooms[code] = {"seq": 0, "players": [], "move": None, "offer": None, "moves": []}
+            self.notify()
+            return 200, {"message": "Room created"}
+        if method == "GET" and action == "delete":
+            self.rooms.pop(code, None)
+            self.notify()
+            return 200, {"message": "Room deleted"}
+        if method == "GET" and action in ("players", "latest-move", "latest-offer"):
+            if code not in self.rooms:
+                return 404, {"message": "Room not found"}
+            return 200, self.rooms[code][FIELDS[action]]
+        if method in ("POST", "DELETE") and action in ("players", "move", "offer"):
+            room = self.rooms.get(code)
+            if room is None:
+                return 404, {"message": "Room not found"}
+            if action == "move" and method == "POST" and not self.log_move(room, data):
+                return 200, {"message": "move already posted"}
+            if method == "POST":
+                room[FIELDS[action]] = data
+            else:
+                room[FIELDS[action]] = [] if action == "players" else None
+            room["seq"] += 1
+            self.notify()
+            return 200, {"message": f"{action} {'updated' if method == 'POST' else 'cleared'}"}
+        return 404, {"message": "Not found"}
+
+    def log_move(self, room, move):
+        # Returns False for a repost of a logged move (a retry), which changes nothing. Any
+        # other numbered move rewrites the log from its ply on, dropping an older game's moves.
+        ply = move.get("ply") if isinstance(move, dict) else None
+        if not isinstance(ply, int):
+            return True # Unnumbered moves only replace the latest one
+        if move in room["moves"]:
+            return False
+        room["moves"] = [logged for logged in room["moves"] if logged["ply"] < ply] + [move]
+        return True
+
+    def moves(self, code, since):
+        """The logged moves after ply since, as (status, response body)."""
+        with self.changed:
+            room = self.rooms.get(code)
+            if room is None:
+                return 404, {"message": "Room not found"}
+            moves = room["moves"]
+            return 200, {"moves": [move for move in moves if move["ply"] > since], "ply": moves[-1]["ply"] if moves else 0}
+
+    def state(self, code, since):
+        """The room's state with its version, or None when the version hasn't passed since."""
+        with self.changed:
+            if code in self.rooms and self.rooms[code]["seq"] <= since:
+                return None
+            state = self.snapshot(code)
+        return {"version": state.pop("seq"), **state}
+
+    def events(self, code, since, timeout):
+        with self.changed:
+            self.changed.wait_for(lambda: code not in self.rooms or self.rooms[code]["seq"] > since, timeout)
+            return self.snapshot(code)
+
+
+class StandinHandler(http.server.BaseHTTPRequestHandler):
+    def send_json(self, status, data, etag=None):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if etag is not None:
+            self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self):
+        url = urllib.parse.urlsplit(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        if len(parts) != 2:
+            return None, None, {}
+        return parts[0], parts[1], urllib.parse.parse_qs(url.query)
+
+    def do_GET(self):
+        code, action, query = self.route()
+        if action == "events":
+            try:
+                since = int(query.get("since", ["0"])[0])
+                timeout = min(float(query.get("timeout", [str(MAX_LONG_POLL_SEC)])[0]), MAX_LONG_POLL_SEC)
+            except ValueError:
+                self.send_json(400, {"message": "Bad since or timeout"})
+                return
+            self.send_json(200, self.server.rooms.events(code, since, timeout))
+        elif action == "state":
+            self.send_state(code, query)
+        elif action == "moves":
+            try:
+                since = int(query.get("since", ["0"])[0])
+            except ValueError:
+                self.send_json(400, {"message": "Bad since"})
+                return
+            self.send_json(*self.server.rooms.moves(code, since))
+        else:
+            self.send_json(*self.server.rooms.request(code, "GET", action, key=self.headers.get("Idempotency-Key")))
+
+    def send_state(self, code, query):
+        try:
+            etag = self.headers.get("If-None-Match", "").strip('"') or "-1"
+            since = int(query.get("since", [etag])[0])
+        except ValueError:
+            self.send_json(400, {"message": "Bad since"})
+            return
+        state = self.server.rooms.state(code, since)
+        if state is None:
+            self.send_response(304)
+            self.send_header("ETag", f'"{since}"')
+            self.end_headers()
+            return
+        self.send_json(200, state, f'"{state["version"]}"')
+
+    def do_POST(self):
+        code, action, _ = self.route()
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"null")
+        except (ValueError, json.JSONDecodeError):
+            self.send_json(400, {"message": "Invalid JSON"})
+            return
+        self.send_json(*self.server.rooms.request(code, "POST", action, data, self.headers.get("Idempotency-Key")))
+
+    def do_DELETE(self):
+        code, action, _ = self.route()
+        self.send_json(*self.server.rooms.request(code, "DELETE", action, key=self.headers.get("Idempotency-Key")))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def make_server(host="127.0.0.1", port=8080, verbose=False, rooms=None):
+    server = http.server.ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    server.rooms = rooms if rooms is not None else Rooms()
+    server.verbose = verbose
+    return server
+
+
+async def push_states(websocket, rooms, code, changed):
+    # Send the room's state on connect and again after every change to it
+    last_state = None
+    while True:
+        changed.clear()
+        with rooms.changed:
+            state = rooms.snapshot(code)
+        if state != last_state:
+            await websocket.send(json.dumps({"type": "state", **state}))
+            last_state = state
+        await changed.wait()
+
+
+async def handle_socket(websocket, rooms):
+    parts = [part for part in urllib.parse.urlsplit(websocket.request.path).path.split("/") if part]
+    if len(parts) != 2 or parts[1] != "ws":
+        await websocket.close(1008, "Unknown path")
+        return
+    code = parts[0]
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+    listener = lambda: loop.call_soon_threadsafe(changed.set)
+    with rooms.changed:
+        rooms.listeners.add(listener)
+    pusher = asyncio.create_task(push_states(websocket, rooms, code, changed))
+    try:
+        async for message in websocket:
+            try:
+                frame = json.loads(message)
+                if frame["method"] == "GET" and frame["path"] == "moves":
+                    status, body = rooms.moves(code, int(frame["data"]["since"]))
+                    if status == 200:
+                        await websocket.send(json.dumps({"type": "moves", **body}))
+                else:
+                    status, body = rooms.request(code, frame["method"], frame["path"], frame.get("data"), frame.get("id"))
+                    if status == 200 and frame.get("id") is not None:
+                        await websocket.send(json.dumps({"type": "ack", "id": frame["id"]}))
+            except (ValueError, KeyError, TypeError):
+                frame, status, body = {}, 400, {"message": "Bad frame"}
+            if status != 200:
+                await websocket.send(json.dumps({"type": "error", "status": status, "path": frame.get("path"),
+                                                 "id": frame.get("id"), **body}))
+    except ConnectionClosed:
+        pass
+    finally:
+        with rooms.changed:
+            rooms.listeners.discard(listener)
+        pusher.cancel()
+
+
+async def serve_sockets(rooms, host, port, ready=None):
+    async with websocket_serve(lambda websocket: handle_socket(websocket, rooms), host, port) as server:
+        if ready is not None:
+            ready(server)
+        await server.serve_forever()
+
+
+def start_socket_server(rooms, host="127.0.0.1", port=8081):
+    """Run the WebSocket side on its own asyncio loop in a daemon thread; returns the bound port."""
+    if websocket_serve is None:
+        raise RuntimeError("the websockets package is required for --websocket-port")
+    bound = []
+    started = threading.Event()
+    def ready(server):
+        bound.append(server.sockets[0].getsockname()[1])
+        started.set()
+    thread = threading.Thread(target=asyncio.run, args=(serve_sockets(rooms, host, port, ready),), daemon=True)
+    thread.start()
+    started.wait(10)
+    return bound[0] if bound else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the online room server.")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on (default 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on (default 8080)")
+    parser.add_argument("--websocket-port", type=int, help="also serve ws://host:PORT/<room>/ws (needs websockets)")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    server = make_server(args.host, args.port, args.verbose)
+    print(f"Stand-in server on http://{args.host}:{server.server_port}/")
+    if args.websocket_port is not None:
+        try:
+            socket_port = start_socket_server(server.rooms, args.host, args.websocket_port)
+        except RuntimeError as e:
+            parser.error(str(e))
+        print(f"WebSocket rooms on ws://{args.host}:{socket_port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
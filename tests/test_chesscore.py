@@ -0,0 +1,66 @@
+"""Round trips of positions through FEN and the packed format, checked along random playouts."""
+import random
+import unittest
+
+from chesscore import Board
+from chesscore.perft import legal_moves
+
+PLAYOUTS = 40
+MAX_PLIES = 150
+
+
+def random_playout(board, seed):
+    # Plays one seeded game of random legal moves on board, yielding after every ply
+    rng = random.Random(seed)
+    for _ in range(MAX_PLIES):
+        moves = list(legal_moves(board, board.turn))
+        if not moves:
+            return
+        board.make_move(*rng.choice(moves))
+        yield
+
+
+class RoundTripTest(unittest.TestCase):
+    def assert_same_position(self, board, other, message):
+        self.assertEqual(other.zobrist_key, board.zobrist_key, message)
+        self.assertEqual(other.zobrist_key, other.compute_zobrist_key(), message)
+        self.assertEqual(other.turn, board.turn, message)
+
+    def test_random_playouts(self):
+        for seed in range(PLAYOUTS):
+            board = Board()
+            start_fen = board.to_fen()
+            for _ in random_playout(board, seed):
+                fen = board.to_fen()
+                message = f"seed {seed}, ply {len(board.undo_stack)}: {fen}"
+                self.assertEqual(board.zobrist_key, board.compute_zobrist_key(), message)
+
+                from_fen = Board.from_fen(fen)
+                self.assertEqual(from_fen.to_fen(), fen, message)
+                self.assert_same_position(board, from_fen, message)
+
+                packed = board.to_bytes()
+                from_bytes = Board.from_bytes(packed)
+                self.assertEqual(from_bytes.to_bytes(), packed, message)
+                self.assert_same_position(board, from_bytes, message)
+                # The packed format drops only the fullmove number
+                self.assertEqual(from_bytes.to_fen().rsplit(" ", 1)[0], fen.rsplit(" ", 1)[0], message)
+
+            while board.undo_stack:
+                board.unmake_move()
+            self.assertEqual(board.to_fen(), start_fen, f"seed {seed} after unmaking every move")
+            self.assertEqual(board.zobrist_key, Board().zobrist_key, f"seed {seed} after unmaking every move")
+
+    def test_malformed_input_raises_value_error(self):
+        for fen in ("", "8/8/8/8 w - -", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1",
+                    "rnbqkbnr/pppppppp/9/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"):
+            with self.assertRaises(ValueError, msg=fen):
+                Board.from_fen(fen)
+        packed = Board().to_bytes()
+        for data in (packed[:-1], packed + b"\0", bytes(33)):
+            with self.assertRaises(ValueError):
+                Board.from_bytes(data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+"""Skipped-ply recovery against the stand-in server, for every transport the client polls with.
+
+Run with `python -m unittest` (or `python -m pytest tests`) from the repository root.
+"""
+import os
+import threading
+import time
+import unittest
+from queue import Queue, Empty
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import requests
+
+import main
+import standin_server
+
+
+def numbered_move(game, ply):
+    return {"from_x": ply % 8, "from_y": 1, "to_x": ply % 8, "to_y": 2, "promotion": None, "fifty_move": 0,
+            "game": game, "ply": ply}
+
+
+class FlakyHandler(standin_server.StandinHandler):
+    # Answers 404 for the endpoints in server.missing (an older server) and 503 for the next
+    # server.failing_moves requests to /moves (a server that is briefly down)
+    def do_GET(self):
+        _, action, _ = self.route()
+        if action in self.server.missing:
+            self.send_json(404, {"message": "Not found"})
+        elif action == "moves" and self.server.failing_moves > 0:
+            self.server.failing_moves -= 1
+            self.send_json(503, {"message": "Try again"})
+        else:
+            super().do_GET()
+
+
+class ResyncTestCase(unittest.TestCase):
+    room = "4242"
+
+    def setUp(self):
+        self.long_poll_timeout_sec = main.long_poll_timeout_sec
+        main.long_poll_timeout_sec = 1 # So a stopped poller's last long poll ends quickly
+        self.rooms = standin_server.Rooms()
+        self.server = standin_server.make_server(port=0, rooms=self.rooms)
+        self.server.RequestHandlerClass = FlakyHandler
+        self.server.missing = set()
+        self.server.failing_moves = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.site = f"http://127.0.0.1:{self.server.server_port}/"
+        self.rooms.request(self.room, "GET", "create")
+        self.move_q = Queue()
+        self.stop_event = threading.Event()
+        self.workers = []
+
+    def tearDown(self):
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(10)
+        self.server.shutdown()
+        self.server.server_close()
+        main.long_poll_timeout_sec = self.long_poll_timeout_sec
+
+    def start_poller(self):
+        schedule = main.PollSchedule(0.05, 0.05, 0.2)
+        worker = threading.Thread(target=main.online_poller,
+                                  args=(requests.Session(), self.site, self.room, self.stop_event, self.move_q,
+                                        Queue(), Queue(), schedule, None, None, None), daemon=True)
+        worker.start()
+        self.workers.append(worker)
+
+    def post_unseen(self, game, plies):
+        # Holding the room's lock keeps every poller from seeing the plies in between
+        with self.rooms.changed:
+            for ply in plies:
+                self.rooms.request(self.room, "POST", "move", numbered_move(game, ply))
+
+    def received(self, count, timeout=10):
+        moves = []
+        deadline = time.monotonic() + timeout
+        while len(moves) < count and time.monotonic() < deadline:
+            try:
+                move = self.move_q.get(timeout=0.1)
+            except Empty:
+                continue
+            if move is not None:
+                moves.append((move["game"], move["ply"]))
+        return moves
+
+    def assert_recovers(self):
+        time.sleep(0.3) # Let the first poll see the empty room
+        self.post_unseen(1, (1, 2, 3))
+        self.assertEqual(self.received(3), [(1, 1), (1, 2), (1, 3)])
+        self.post_unseen(1, (4, 5))
+        self.assertEqual(self.received(2), [(1, 4), (1, 5)])
+        # A new game starts counting again and must not replay the last game's moves
+        self.post_unseen(2, (1, 2))
+        self.assertEqual(self.received(2), [(2, 1), (2, 2)])
+        self.assertEqual(self.received(1, timeout=0.5), [])
+
+
+class PollerResyncTest(ResyncTestCase):
+    def test_events(self):
+        self.start_poller()
+        self.assert_recovers()
+
+    def test_state(self):
+        self.server.missing.add("events")
+        self.start_poller()
+        self.assert_recovers()
+
+    def test_legacy(self):
+        self.server.missing.update(("events", "state"))
+        self.start_poller()
+        self.assert_recovers()
+
+    def assert_recovers_after_failed_moves(self):
+        self.server.failing_moves = 2
+        self.start_poller()
+        time.sleep(0.3)
+        self.post_unseen(1, (1, 2, 3))
+        self.assertEqual(self.received(3), [(1, 1), (1, 2), (1, 3)])
+        self.assertEqual(self.server.failing_moves, 0)
+
+    def test_events_failed_moves(self):
+        self.assert_recovers_after_failed_moves()
+
+    def test_state_failed_moves(self):
+        self.server.missing.add("events")
+        self.assert_recovers_after_failed_moves()
+
+    def test_legacy_failed_moves(self):
+        self.server.missing.update(("events", "state"))
+        self.assert_recovers_after_failed_moves()
+
+    def test_no_move_log(self):
+        # Against a server without /moves the latest move is still reported
+        self.server.missing.update(("events", "moves"))
+        self.start_poller()
+        time.sleep(0.3)
+        self.post_unseen(1, (1, 2, 3))
+        self.assertEqual(self.received(1), [(1, 3)])
+
+    def test_stopped_poller_reports_nothing(self):
+        self.start_poller()
+        time.sleep(0.3)
+        self.stop_event.set()
+        self.post_unseen(1, (1, 2, 3))
+        self.workers[0].join(10)
+        self.assertFalse(self.workers[0].is_alive())
+        self.assertEqual(self.received(1, timeout=0.5), [])
+
+
+@unittest.skipIf(main.websocket_connect is None or standin_server.websocket_serve is None,
+                 "needs websockets 15 or newer")
+class SocketResyncTest(ResyncTestCase):
+    def test_socket(self):
+        port = standin_server.start_socket_server(self.rooms, port=0)
+        worker = threading.Thread(target=main.online_socket_worker,
+                                  args=(f"ws://127.0.0.1:{port}/", self.room, self.stop_event, Queue(),
+                                        self.move_q, Queue(), Queue()), daemon=True)
+        worker.start()
+        self.workers.append(worker)
+        self.assert_recovers()
+
+
+if __name__ == "__main__":
+    unittest.main()
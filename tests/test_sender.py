@@ -0,0 +1,217 @@
+"""Delivery of the client's sends against the stand-in server: retries, idempotency and coalescing."""
+import json
+import os
+import threading
+import time
+import unittest
+from queue import Queue, Empty
+from unittest import mock
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import requests
+
+import main
+import standin_server
+
+
+class CountingRooms(standin_server.Rooms):
+    # Records every request that actually changed or read the room, retries excluded
+    def __init__(self):
+        super().__init__()
+        self.applied = []
+
+    def apply(self, code, method, action, data):
+        self.applied.append((method, action, data))
+        return super().apply(code, method, action, data)
+
+
+class FlakyHandler(standin_server.StandinHandler):
+    # Answers 503 to the next server.unavailable requests, as a server starting up would, and
+    # applies the next server.slow ones but answers too late for the client to see the reply
+    def do_POST(self):
+        self.server.posts += 1
+        if self.server.unavailable > 0:
+            self.server.unavailable -= 1
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            self.send_json(503, {"message": "Starting up"})
+        elif self.server.slow > 0:
+            self.server.slow -= 1
+            code, action, _ = self.route()
+            data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            self.server.rooms.request(code, "POST", action, data, self.headers.get("Idempotency-Key"))
+            time.sleep(1.5)
+        else:
+            super().do_POST()
+
+    def do_DELETE(self):
+        if self.server.unavailable > 0:
+            self.server.unavailable -= 1
+            self.send_json(503, {"message": "Starting up"})
+        else:
+            super().do_DELETE()
+
+
+class SenderTestCase(unittest.TestCase):
+    room = "4343"
+
+    def setUp(self):
+        for name, value in (("send_queue", Queue(maxsize=64)), ("ack_queue", Queue()), ("unacked_sends", {}),
+                            ("send_timeout_sec", (2, 1)), ("send_retry_deadline_sec", 20)):
+            patcher = mock.patch.object(main, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.rooms = CountingRooms()
+        self.rooms.request(self.room, "GET", "create")
+        self.stop_event = threading.Event()
+        self.workers = []
+
+    def tearDown(self):
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join(10)
+
+    def acks(self, count, timeout=15):
+        acks = {}
+        deadline = time.monotonic() + timeout
+        while len(acks) < count and time.monotonic() < deadline:
+            try:
+                message_id, status = main.ack_queue.get(timeout=0.1)
+            except Empty:
+                continue
+            acks[message_id] = status
+        return acks
+
+    def applied(self, action):
+        return [(method, data) for method, applied_action, data in self.rooms.applied if applied_action == action]
+
+
+class HttpSenderTest(SenderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.server = standin_server.make_server(port=0, rooms=self.rooms)
+        self.server.RequestHandlerClass = FlakyHandler
+        self.server.unavailable = 0
+        self.server.slow = 0
+        self.server.posts = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        super().tearDown()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def start_sender(self):
+        site = f"http://127.0.0.1:{self.server.server_port}/"
+        worker = threading.Thread(target=main.online_sender,
+                                  args=(requests.Session(), self.stop_event, main.send_queue, site, self.room),
+                                  daemon=True)
+        worker.start()
+        self.workers.append(worker)
+
+    def test_retries_unavailable_server_in_order(self):
+        self.server.unavailable = 2
+        self.start_sender()
+        first = main.queue_send("POST", "move", {"game": 1, "ply": 1})
+        second = main.queue_send("POST", "move", {"game": 1, "ply": 2})
+        self.assertEqual(self.acks(2), {first: "delivered", second: "delivered"})
+        self.assertEqual([data["ply"] for _, data in self.applied("move")], [1, 2])
+
+    def test_retry_of_applied_request_is_not_applied_again(self):
+        # The first reply comes after the client's read timeout, so the client sends the move again
+        self.server.slow = 1
+        self.start_sender()
+        message_id = main.queue_send("POST", "offer", {"type": "draw", "color": "white"})
+        self.assertEqual(self.acks(1), {message_id: "delivered"})
+        self.assertEqual(self.server.posts, 2)
+        self.assertEqual(self.applied("offer"), [("POST", {"type": "draw", "color": "white"})])
+        self.assertEqual(self.rooms.rooms[self.room]["seq"], 1)
+
+    def test_newer_offer_supersedes_queued_one(self):
+        older = main.queue_send("POST", "offer", {"type": "draw", "color": "white"})
+        newer = main.queue_send("POST", "offer", {"type": "resign", "color": "white"})
+        self.start_sender()
+        self.assertEqual(self.acks(2), {older: "superseded", newer: "delivered"})
+        self.assertEqual(self.applied("offer"), [("POST", {"type": "resign", "color": "white"})])
+
+    def test_delete_does_not_supersede_queued_offer(self):
+        ours = main.queue_send("POST", "offer", {"type": "resign", "color": "white"})
+        cleared = main.queue_send("DELETE", "offer", None)
+        self.start_sender()
+        self.assertEqual(self.acks(2), {ours: "delivered", cleared: "delivered"})
+        self.assertEqual(self.applied("offer"), [("POST", {"type": "resign", "color": "white"}), ("DELETE", None)])
+
+    def test_rejected_request_fails_without_retrying(self):
+        self.rooms.request(self.room, "GET", "delete")
+        self.start_sender()
+        message_id = main.queue_send("POST", "move", {"game": 1, "ply": 1})
+        self.assertEqual(self.acks(1), {message_id: "failed"})
+        self.assertEqual(self.server.posts, 1)
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        sent = [main.queue_send("POST", "move", {"game": 1, "ply": ply}) for ply in range(1, 71)]
+        self.assertEqual(sum(message_id is None for message_id in sent), 6)
+        self.assertEqual(len(main.unacked_sends), 64)
+
+
+@unittest.skipIf(main.websocket_connect is None or standin_server.websocket_serve is None,
+                 "needs websockets 15 or newer")
+class SocketSenderTest(SenderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.drop = None # "before" or "after" applying the next request with an id, then close
+        handle_socket = standin_server.handle_socket
+
+        async def dropping_handle_socket(websocket, rooms):
+            if self.drop is None:
+                return await handle_socket(websocket, rooms)
+            async for message in websocket:
+                frame = json.loads(message)
+                if frame.get("id") is not None:
+                    if self.drop == "after":
+                        rooms.request(self.room, frame["method"], frame["path"], frame.get("data"), frame["id"])
+                    self.drop = None
+                    await websocket.close()
+                    return
+
+        patcher = mock.patch.object(standin_server, "handle_socket", dropping_handle_socket)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.port = standin_server.start_socket_server(self.rooms, port=0)
+
+    def start_worker(self, room=None):
+        worker = threading.Thread(target=main.online_socket_worker,
+                                  args=(f"ws://127.0.0.1:{self.port}/", room or self.room, self.stop_event,
+                                        main.send_queue, Queue(), Queue(), Queue()), daemon=True)
+        worker.start()
+        self.workers.append(worker)
+
+    def assert_resent_once(self, drop):
+        self.drop = drop
+        self.start_worker()
+        message_id = main.queue_send("POST", "move", {"game": 1, "ply": 1})
+        self.assertEqual(self.acks(1), {message_id: "delivered"})
+        self.assertEqual(self.applied("move"), [("POST", {"game": 1, "ply": 1})])
+
+    def test_resends_request_lost_with_connection(self):
+        self.assert_resent_once("before")
+
+    def test_resent_request_already_applied_is_not_applied_again(self):
+        self.assert_resent_once("after")
+
+    def test_rejected_request_fails(self):
+        self.start_worker(room="missing")
+        message_id = main.queue_send("POST", "move", {"game": 1, "ply": 1})
+        self.assertEqual(self.acks(1), {message_id: "failed"})
+
+    def test_stopping_waits_for_acknowledgement(self):
+        self.start_worker()
+        message_id = main.queue_send("DELETE", "players", None)
+        self.stop_event.set()
+        self.assertEqual(self.acks(1), {message_id: "delivered"})
+        self.workers[0].join(10)
+        self.assertFalse(self.workers[0].is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()